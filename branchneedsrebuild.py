@@ -1,18 +1,29 @@
 #!/usr/bin/python3
 import argparse
-import json
 import requests
 import subprocess
 import sys
-import urllib.request
 import yaml
 
 from launchpadlib.launchpad import Launchpad
 from launchpadlib.credentials import AuthorizeRequestTokenWithURL
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 STORE_URL = "https://api.snapcraft.io/api/v1/snaps/details/{snap}?channel={channel}"
 STORE_HEADERS = {"X-Ubuntu-Series": "16", "X-Ubuntu-Architecture": "{arch}"}
 
+# seconds to wait for an answer from the servers
+TIMEOUT = 30
+
+# a single session, to reuse the connections to the store; the requests
+# that fail with a temporary error are retried
+session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[502, 503, 504]))
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "-b", "--branch", help="Upstream branch to check", default="stable",
@@ -42,12 +53,13 @@ def store_parse_versions(package):
     """Build a dictionnary of the channels and versions of a snap in the store"""
     result = {}
     # the store wants a Snap-Device-Series header
-    req = urllib.request.Request(
+    snapdetails = session.get(
         "http://api.snapcraft.io/v2/snaps/info/%s" % package,
         headers={"Content-Type": "application/json", "Snap-Device-Series": "16"},
+        timeout=TIMEOUT,
     )
-    snapdetails = urllib.request.urlopen(req)
-    report = json.load(snapdetails)
+    snapdetails.raise_for_status()
+    report = snapdetails.json()
     for items in report["channel-map"]:
         larch = items["channel"]["architecture"]
         lchannel = items["channel"]["name"]
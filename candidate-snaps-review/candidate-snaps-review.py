@@ -4,12 +4,25 @@ import argparse
 import json
 import os
 import subprocess
-import urllib.request
 
+import requests
 import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import snaps
 
+# seconds to wait for an answer from the servers
+TIMEOUT = 30
+
+# a single session, to reuse the connections to the store; the requests
+# that fail with a temporary error are retried
+session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[502, 503, 504]))
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
 # use existing cache
 try:
     with open("candidate.yml", "r") as candidatereport:
@@ -41,13 +54,14 @@ def store_parse_versions(package):
     """Build a dictionnary of the channels and revisions of a snap in the store"""
     result = {}
     # the store wants a Snap-Device-Series header
-    req = urllib.request.Request(
+    snapdetails = session.get(
         "http://api.snapcraft.io/v2/snaps/info/%s" % package,
         headers={"Content-Type": "application/json", "Snap-Device-Series": "16"},
+        timeout=TIMEOUT,
     )
-    snapdetails = urllib.request.urlopen(req)
+    snapdetails.raise_for_status()
 
-    store = json.load(snapdetails)
+    store = snapdetails.json()
     for items in store["channel-map"]:
         larch = items["channel"]["architecture"]
         lchannel = items["channel"]["name"]
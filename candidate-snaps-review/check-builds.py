@@ -1,25 +1,39 @@
 #!/usr/bin/python3
 
-import json
 import re
 import sys
-import urllib.request
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import snaps
 
+# seconds to wait for an answer from the servers
+TIMEOUT = 30
+
+# a single session, to reuse the connections to Github and Launchpad; the requests
+# that fail with a temporary error are retried
+session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[502, 503, 504]))
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
 if(len(sys.argv) != 3):
     print("Usage: two arguments are required, the issues API url for the repo and the token used by the action.")
     print("./check-builds.py https://api.github.com/repos/${{ github.repository }}/issues ${{ secrets.GITHUB_TOKEN }}")
     sys.exit()
 
-req = urllib.request.Request(sys.argv[1])
-issues = json.load(urllib.request.urlopen(req))
+issues_res = session.get(sys.argv[1], timeout=TIMEOUT)
+issues_res.raise_for_status()
+issues = issues_res.json()
 
 def get_builds(launchpad_url):
-    req = urllib.request.Request(launchpad_url)
-    builds_res = urllib.request.urlopen(req)
+    builds_res = session.get(launchpad_url, timeout=TIMEOUT)
+    builds_res.raise_for_status()
 
-    builds = json.load(builds_res)
+    builds = builds_res.json()
     arch = dict()
     i=0
     while(builds["entries"][i]["arch_tag"] not in arch):
@@ -35,13 +49,13 @@ def open_issue(name, arch, url):
     headers = {
         "authorization": "Bearer %s" % sys.argv[2],
         }
-    req = urllib.request.Request(
+    res = session.post(
         sys.argv[1],
-        method="POST",
         headers=headers,
-        data=bytes(json.dumps(data), encoding="utf-8"),
+        json=data,
+        timeout=TIMEOUT,
     )
-    urllib.request.urlopen(req)
+    res.raise_for_status()
 
 def check_for_issues(name, arch):
     for entry in issues:
@@ -60,13 +74,14 @@ def close_issue(n):
     headers = {
         "authorization": "Bearer %s" % sys.argv[2],
         }
-    req = urllib.request.Request(
+    res = session.request(
+        "PATCH",
         sys.argv[1]+f"/{n}",
-        method="PATCH",
         headers=headers,
-        data=bytes(json.dumps(close_data), encoding="utf-8"),
+        json=close_data,
+        timeout=TIMEOUT,
     )
-    urllib.request.urlopen(req)
+    res.raise_for_status()
       
 # iterate over the list of snaps
 for snapline in snaps.normalsnaps + snaps.specialsnaps:
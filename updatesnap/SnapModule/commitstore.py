@@ -0,0 +1,55 @@
+""" Local store for commit metadata. The data of a commit can never change
+    for a given SHA, so, unlike the HTTP cache, it never needs to be
+    revalidated against the server. """
+
+import datetime
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+class CommitStore:
+    """ Stores the date of each commit in a SQLite database, keyed by
+        repository and SHA """
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS commits ("
+                                     "repository TEXT NOT NULL, "
+                                     "sha TEXT NOT NULL, "
+                                     "date TEXT NOT NULL, "
+                                     "PRIMARY KEY (repository, sha))")
+
+    def get_date(self, repository: str, sha: str) -> Optional[datetime.datetime]:
+        """ Returns the date of a commit, or None if it isn't in the store """
+        with self._lock:
+            row = self._connection.execute("SELECT date FROM commits "
+                                           "WHERE repository = ? AND sha = ?",
+                                           (repository, sha)).fetchone()
+        if row is None:
+            return None
+        return datetime.datetime.fromisoformat(row[0])
+
+    def set_date(self, repository: str, sha: str, date: datetime.datetime):
+        """ Stores the date of a commit """
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO commits (repository, sha, date) "
+                                     "VALUES (?, ?, ?)", (repository, sha, date.isoformat()))
+
+    def close(self):
+        """ Closes the database """
+        with self._lock:
+            self._connection.close()
+
+
+def new_commit_store(arguments) -> Optional[CommitStore]:
+    """ Creates the commit store if the cache was enabled in the command
+        line (see add_cache_arguments()) """
+    if not arguments.cache_dir:
+        return None
+    return CommitStore(os.path.join(arguments.cache_dir, "commits.sqlite"))
@@ -0,0 +1,154 @@
+""" On-disk cache for HTTP responses. Each response is stored with its
+    validators (ETag and Last-Modified), to revalidate it later with a
+    conditional request. Unchanged resources are answered with a
+    '304 Not Modified', which doesn't count against the API rate limits. """
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from requests.structures import CaseInsensitiveDict
+
+
+class CachedResponse:
+    # pylint: disable=too-few-public-methods
+    """ A response loaded from the cache. It implements the part of the
+        requests.Response interface used by the GIT classes. """
+    def __init__(self, status_code: int, headers: dict, content: bytes):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    def json(self):
+        """ Returns the content decoded as JSON """
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    """ Stores HTTP responses in a folder, one file per URI, and evicts the
+        least recently used ones when the total size exceeds the limit. """
+    _STORED_HEADERS = ['ETag', 'Last-Modified', 'Link', 'Content-Type']
+
+    def __init__(self, folder: str, max_size: int = 256 * 1024 * 1024):
+        self._folder = folder
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(folder)
+                         if entry.is_file())
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self._folder,
+                            hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """ Returns the cached response for a key, or None if it isn't
+            in the cache. """
+        path = self._get_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if entry['key'] != key:
+            return None
+        return CachedResponse(entry['status_code'], entry['headers'],
+                              base64.b64decode(entry['content']))
+
+    @staticmethod
+    def get_validators(response: CachedResponse) -> dict:
+        """ Returns the headers needed to revalidate a cached response """
+        headers = {}
+        if 'ETag' in response.headers:
+            headers['If-None-Match'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers
+
+    def hit(self, key: str):
+        """ Notifies that the cached response for a key is still valid """
+        try:
+            os.utime(self._get_path(key))
+        except OSError:
+            pass
+        with self._lock:
+            self._hits += 1
+
+    def store(self, key: str, response):
+        """ Stores a response, but only if it has validators that allow
+            to check later whether it is still valid. """
+        with self._lock:
+            self._misses += 1
+        if response.status_code != 200:
+            return
+        headers = {}
+        for header in self._STORED_HEADERS:
+            if header in response.headers:
+                headers[header] = response.headers[header]
+        if ('ETag' not in headers) and ('Last-Modified' not in headers):
+            return
+        entry = json.dumps({"key": key,
+                            "status_code": response.status_code,
+                            "headers": headers,
+                            "content": base64.b64encode(response.content).decode('ascii')})
+        path = self._get_path(key)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self._folder,
+                                             delete=False) as cache_file:
+                cache_file.write(entry)
+            os.replace(cache_file.name, path)
+            self._size += os.path.getsize(path)
+            if self._size > self._max_size:
+                self._evict()
+
+    def _evict(self):
+        """ Removes the least recently used entries until the size of the
+            cache is below the limit. Must be called with the lock held. """
+        entries = [entry for entry in os.scandir(self._folder) if entry.is_file()]
+        entries.sort(key=lambda x: x.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self._max_size:
+                break
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            self._size -= size
+            self._evictions += 1
+
+    def get_stats(self) -> dict:
+        """ Returns the number of hits, misses and evictions of the cache """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses,
+                    "evictions": self._evictions, "size": self._size}
+
+    def get_summary(self) -> str:
+        """ Returns the statistics of the cache as a human readable text """
+        stats = self.get_stats()
+        return (f"HTTP cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['evictions']} evictions")
+
+
+def add_cache_arguments(parser):
+    """ Adds the command line arguments that enable the cache to an
+        argparse parser """
+    parser.add_argument('--cache-dir', action='store', default=None,
+                        help='Folder where to keep the HTTP responses and the commit '
+                        'data between runs.')
+    parser.add_argument('--cache-size', action='store', type=int, default=256,
+                        help='Maximum size of the HTTP cache, in megabytes.')
+
+
+def new_cache(arguments) -> Optional[HTTPCache]:
+    """ Creates the HTTP cache if it was enabled in the command line """
+    if not arguments.cache_dir:
+        return None
+    return HTTPCache(os.path.join(arguments.cache_dir, "http"),
+                     arguments.cache_size * 1024 * 1024)
@@ -0,0 +1,105 @@
+""" Shared HTTP client for all the tools. Every request goes through the
+    same connection pools, so the connections to each host are kept alive
+    and reused instead of doing a new TCP and TLS handshake each time, and
+    all of them share the same timeout and retry policy. """
+
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HTTPClient:
+    """ Keeps a pool of connections for each host. Each thread uses its
+        own requests.Session, but all of them share the same adapters,
+        and so the same connection pools. """
+    def __init__(self, pool_connections: int = 16, pool_maxsize: int = 16,
+                 timeout: float = 30, retries: int = 3):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._timeout = timeout
+        self._retries = retries
+        self._adapter = None
+        self.configure(pool_connections, pool_maxsize, timeout, retries)
+
+    def configure(self, pool_connections: int = 16, pool_maxsize: int = 16,
+                  timeout: float = 30, retries: Optional[int] = None):
+        """ Sets the number of hosts with a connection pool, the maximum
+            number of connections kept alive for each host, the timeout
+            of each request, and the number of retries for connection
+            errors and temporary server errors. If the number of retries
+            isn't specified, the current one is kept. """
+        if retries is None:
+            retries = self._retries
+        if retries == 0:
+            # the caller does its own retries
+            retry = 0
+        else:
+            # POST and PATCH requests aren't idempotent, so they are never retried
+            retry = Retry(total=retries, backoff_factor=0.5,
+                          status_forcelist=(502, 503, 504),
+                          allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                          raise_on_status=False)
+        with self._lock:
+            self._timeout = timeout
+            self._retries = retries
+            # when all the connections to a host are in use, wait for one
+            # instead of opening (and later discarding) extra connections
+            self._adapter = HTTPAdapter(pool_connections=pool_connections,
+                                        pool_maxsize=pool_maxsize, max_retries=retry,
+                                        pool_block=True)
+
+    def _get_session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if (session is None) or (self._local.adapter is not self._adapter):
+            with self._lock:
+                adapter = self._adapter
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            self._local.adapter = adapter
+        return session
+
+    def request(self, method: str, uri: str, **kwargs) -> requests.Response:
+        """ Does an HTTP request using the shared connection pools """
+        kwargs.setdefault("timeout", self._timeout)
+        return self._get_session().request(method, uri, **kwargs)
+
+    def get(self, uri: str, **kwargs) -> requests.Response:
+        """ Does a GET request using the shared connection pools """
+        return self.request("GET", uri, **kwargs)
+
+    def post(self, uri: str, **kwargs) -> requests.Response:
+        """ Does a POST request using the shared connection pools """
+        return self.request("POST", uri, **kwargs)
+
+
+_CLIENT = HTTPClient()
+# the GIT backends retry the requests with their own scheduler, so this
+# client doesn't retry them again
+_NO_RETRIES_CLIENT = HTTPClient(retries=0)
+
+
+def get_client(retries: bool = True) -> HTTPClient:
+    """ Returns the HTTP client shared by all the tools. If 'retries' is
+        False, it returns the one that doesn't retry the failed requests,
+        for the callers that do their own retries. """
+    return _CLIENT if retries else _NO_RETRIES_CLIENT
+
+
+def configure_clients(pool_connections: int = 16, pool_maxsize: int = 16,
+                      timeout: float = 30):
+    """ Sets the size of the connection pools and the timeout of both
+        shared clients, keeping their retries """
+    for client in (_CLIENT, _NO_RETRIES_CLIENT):
+        client.configure(pool_connections, pool_maxsize, timeout)
+
+
+def add_pool_arguments(parser):
+    """ Adds the command line arguments of the connection pools to an
+        argparse parser """
+    parser.add_argument('--pool-size', action='store', type=int, default=16,
+                        help='Maximum number of connections kept alive for each host.')
@@ -1,5 +1,41 @@
+import collections
 from typing import Optional
 
+import yaml
+
+
+def get_extended_yaml(lines: list, ext_name: str) -> tuple:
+    """ Receives the lines of a YAML file and returns its text with the
+        comments that follow a '# ext:ext_name' line enabled, until a
+        '# endext' line or a non-comment line is found. Those comments are
+        enabled by replacing the '#' with a blank space, so the format is
+        preserved. It also returns whether the file has any of those blocks.
+        This allows to add extra fields in a YAML file without breaking
+        compatibility with snapcraft, and, thanks to the 'ext_name' part,
+        to have blocks for several programs in the same file. """
+
+    new_lines = []
+    replace_comments = False
+    has_extensions = False
+    for line in lines:
+        if not line.startswith('#'):
+            new_lines.append(line)
+            replace_comments = False
+            continue
+        # the line contains a valid comment
+        if line == f'# ext:{ext_name}':
+            has_extensions = True
+            replace_comments = True
+            continue
+        if line == '# endext':
+            replace_comments = False
+            continue
+        if replace_comments and (line[2:3] == ' '):
+            line = ' ' + line[1:]
+        new_lines.append(line)
+    return '\n'.join(new_lines), has_extensions
+
+
 class ManageYAML:
     """ This class takes a YAML file and splits it in an array with each
         block, preserving the child structure to allow to re-create it without
@@ -7,48 +43,232 @@ class ManageYAML:
         because it deletes things like comments. """
     def __init__(self, yaml_data: str):
         self._original_data = yaml_data
-        self._tree = self._split_yaml(yaml_data.split('\n'))[1]
+        self._lines = yaml_data.split('\n')
+        self._tree = self._split_yaml(self._lines)
+        # the lines changed with apply_updates(), to patch the original text
+        self._edits = {}
+        self._build_index()
 
-    def _split_yaml(self, contents: str, level: int = 0, clevel: int = 0,
-                    separator: str = ' ') -> tuple[list, str]:
+    def _split_yaml(self, contents: list) -> list:
         """ Transform a YAML text file into a tree
 
         Splits a YAML file in lines in a format that preserves the structure,
-        the order and the comments. """
+        the order and the comments. The lines are read in a single pass,
+        keeping a stack with the blocks that are still open, so the time
+        needed grows linearly with the size of the file. Each entry also
+        keeps the number of its line and the offset where that line starts
+        in the original text, to allow to patch it. """
 
-        data = []
-        while len(contents) != 0:
-            if len(contents[0].lstrip()) == 0 or contents[0][0] == '#':
+        tree = []
+        separator = ' '
+        # each open block: its indentation, its child level, its entries,
+        # and the entries of the block that contains it
+        stack = [(0, 0, tree, None)]
+        index = 0
+        offset = 0
+        while index < len(contents):
+            line = contents[index]
+            level, clevel, data, parent = stack[-1]
+            if len(line.lstrip()) == 0 or line[0] == '#':
                 if data[-1]['child'] is None:
                     data[-1]['child'] = []
                 data[-1]['child'].append({'separator': '',
-                                          'data': contents[0].lstrip(),
+                                          'data': line.lstrip(),
                                           'child': None,
-                                          'level': clevel + 1})
-                contents = contents[1:]
+                                          'level': clevel + 1,
+                                          'line': index,
+                                          'offset': offset})
+                index += 1
+                offset += len(line) + 1
+                continue
+            if not line.startswith(separator * level):
+                # this block ends; the line belongs to one of the outer blocks
+                stack.pop()
+                self._close_block(parent, data)
                 continue
-            if not contents[0].startswith(separator * level):
-                return contents, data
             if level == 0:
-                if contents[0][0] == ' ' or contents[0][0] == '\t':
-                    separator = contents[0][0]
-            if contents[0][level] != separator:
+                if line[0] == ' ' or line[0] == '\t':
+                    separator = line[0]
+            if line[level] != separator:
                 data.append({'separator': separator * level,
-                             'data': contents[0].lstrip(),
+                             'data': line.lstrip(),
                              'child': None,
-                             'level': clevel})
-                contents = contents[1:]
+                             'level': clevel,
+                             'line': index,
+                             'offset': offset})
+                index += 1
+                offset += len(line) + 1
+                continue
+            new_level = level
+            while line[new_level] == separator:
+                new_level += 1
+            stack.append((new_level, clevel + 1, [], data))
+        while len(stack) > 1:
+            _, _, data, parent = stack.pop()
+            self._close_block(parent, data)
+        return tree
+
+    @staticmethod
+    def _close_block(parent: list, data: list):
+        """ Adds the entries of a block to the last entry of the block
+            that contains it """
+        if parent[-1]['child'] is None:
+            parent[-1]['child'] = data
+        else:
+            parent[-1]['child'] += data
+
+    @staticmethod
+    def _get_key(entry: dict) -> Optional[str]:
+        """ Returns the name of the element in an entry, like 'source-tag'
+            for 'source-tag: 1.0', or None if it isn't a 'name: value' entry """
+        data = entry['data']
+        if (data == '') or (data[0] in '#-') or (':' not in data):
+            return None
+        return data.split(':', 1)[0]
+
+    def _build_index(self):
+        """ Builds the index of the entries by their path, like
+            ('parts', 'glib', 'source-tag'), and the index of the parts.
+            The tree is walked level by level, so, if a path is repeated,
+            the first entry in the file is the one kept. """
+
+        self._index = {}
+        pending = collections.deque([((), self._tree)])
+        while pending:
+            path, group = pending.popleft()
+            for entry in group:
+                key = self._get_key(entry)
+                if key is None:
+                    continue
+                self._index.setdefault(path + (key,), entry)
+                if entry['child']:
+                    pending.append((path + (key,), entry['child']))
+        self._parts = {}
+        for entry in self._tree:
+            if (entry['data'] != 'parts:') or (entry['child'] is None):
+                continue
+            for entry2 in entry['child']:
+                if entry2['data'].endswith(':'):
+                    self._parts.setdefault(entry2['data'][:-1], entry2)
+
+    def get_config(self, ext_name: str = 'updatesnap') -> tuple:
+        """ Returns the contents of the YAML file loaded as data, with the
+            blocks of the 'ext_name' extension enabled, and whether the file
+            has any of those blocks. It reuses the lines already split for
+            the tree. Each call returns new data, so the caller can change
+            it. The entry of each element of a part can be found with
+            get_part_entry(). """
+
+        text, has_extensions = get_extended_yaml(self._lines, ext_name)
+        return yaml.safe_load(text), has_extensions
+
+    def get_part_entry(self, part_name: str, element: str) -> Optional[dict]:
+        """ Returns the entry of an element of a part, like 'source-tag',
+            using the names of the data returned by get_config(), or None
+            if the part doesn't have that element in the file """
+
+        return self._index.get(('parts', part_name, element))
+
+    def update_part_element(self, part_name: str, element: str, value: str) -> bool:
+        """ Replaces the value of an element of a part, written as it must
+            be in the file (for example, "'2.80.0'"). Returns False if the
+            part doesn't have that element in the file. """
+
+        return len(self.apply_updates({('parts', part_name, element): value})) == 0
+
+    def get_entry(self, path: tuple) -> Optional[dict]:
+        """ Returns the entry of an element from its path, like
+            ('parts', 'glib', 'source-tag'), or None if it doesn't exist """
+
+        return self._index.get(tuple(path))
+
+    def apply_updates(self, updates: dict) -> list:
+        """ Replaces the value of several elements at once. The keys are
+            the paths of the elements, and the values are the new values,
+            written as they must be in the file (for example, "'2.80.0'").
+            The changed lines are also recorded, to allow to get the
+            original text with only those lines patched. Returns the paths
+            that aren't in the file. """
+
+        missing = []
+        for path, value in updates.items():
+            entry = self.get_entry(path)
+            if entry is None:
+                missing.append(path)
                 continue
-            old_level = level
-            while contents[0][level] == separator:
-                level += 1
-            contents, inner_data = self._split_yaml(contents, level, clevel+1, separator)
-            level = old_level
-            if data[-1]['child'] is None:
-                data[-1]['child'] = inner_data
+            entry['data'] = f"{self._get_key(entry)}: {value}"
+            line = self._lines[entry['line']]
+            self._edits[entry['line']] = (entry, line[:len(line) - len(line.lstrip())] +
+                                          entry['data'])
+        return missing
+
+    def iter_patched_yaml(self):
+        """ Yields the original text with only the lines changed by
+            apply_updates() replaced. The rest of the text is copied as is,
+            in slices between the changed lines, so the cost depends on the
+            number of changes instead of on the number of entries. """
+        start = 0
+        for line in sorted(self._edits):
+            entry, new_line = self._edits[line]
+            yield self._original_data[start:entry['offset']]
+            yield new_line
+            start = entry['offset'] + len(self._lines[line])
+        yield self._original_data[start:]
+
+    def write_patched_yaml(self, output_file):
+        """ Writes the original text, with the lines changed by
+            apply_updates() patched, into a file object """
+        output_file.writelines(self.iter_patched_yaml())
+
+    def get_patched_yaml(self) -> str:
+        """ Returns the original text with the lines changed by
+            apply_updates() patched """
+        return ''.join(self.iter_patched_yaml())
+
+    def get_diff(self, filename: str = 'snapcraft.yaml', context: int = 3) -> str:
+        """ Returns the changes done with apply_updates() as a unified
+            diff. Only the changed lines and their context are read, so the
+            rest of the file isn't compared. """
+        edits = sorted(line for line in self._edits
+                       if self._edits[line][1] != self._lines[line])
+        if not edits:
+            return ''
+        # with a final new line, split() returns an empty element after it
+        if self._lines[-1] == '':
+            total = len(self._lines) - 1
+            no_eol = False
+        else:
+            total = len(self._lines)
+            no_eol = True
+        hunks = []
+        for line in edits:
+            if hunks and (line - hunks[-1][-1] <= 2 * context):
+                hunks[-1].append(line)
             else:
-                data[-1]['child'] += inner_data
-        return [], data
+                hunks.append([line])
+        diff = [f"--- a/{filename}\n", f"+++ b/{filename}\n"]
+        for hunk in hunks:
+            first = max(0, hunk[0] - context)
+            last = min(total, hunk[-1] + context + 1)
+            lines = f"{first + 1}" if last - first == 1 else f"{first + 1},{last - first}"
+            diff.append(f"@@ -{lines} +{lines} @@\n")
+            changed = set(hunk)
+            removed = []
+            added = []
+            for line in range(first, last):
+                end = '\n\\ No newline at end of file\n' if no_eol and (line == total - 1) \
+                    else '\n'
+                if line in changed:
+                    removed.append(f"-{self._lines[line]}{end}")
+                    added.append(f"+{self._edits[line][1]}{end}")
+                    continue
+                # consecutive changed lines are shown as a block
+                diff += removed + added
+                removed = []
+                added = []
+                diff.append(f" {self._lines[line]}{end}")
+            diff += removed + added
+        return ''.join(diff)
 
     def get_part_data(self, part_name: str) -> Optional[dict]:
         """ Returns all the entries of an specific part of the current
@@ -56,16 +276,10 @@ class ManageYAML:
             with several parts. It returns None if that part doesn't
             exist """
 
-        for entry in self._tree:
-            if entry['data'] != 'parts:':
-                continue
-            if ('child' not in entry) or (entry['child'] is None):
-                continue
-            for entry2 in entry['child']:
-                if entry2['data'] != f'{part_name}:':
-                    continue
-                return entry2['child']
-        return None
+        entry = self._parts.get(part_name)
+        if entry is None:
+            return None
+        return entry['child']
 
     def get_part_element(self, part_name: str, element: str) -> Optional[dict]:
         """ Returns an specific entry for an specific part in the YAML file.
@@ -79,24 +293,42 @@ class ManageYAML:
                     return entry
         return None
 
-    def _get_yaml_group(self, group):
-        data = ""
-        for entry in group:
-            data += entry['separator']
-            data += entry['data']
-            data += '\n'
-            if entry['child']:
-                data += self._get_yaml_group(entry['child'])
-        return data
+    def iter_yaml(self, chunk_lines: int = 1024):
+        """ Yields the YAML file updated with the new versions, in chunks of
+            about 'chunk_lines' lines. The tree is walked with a stack
+            instead of recursion. Like get_yaml(), the spaces and blank
+            lines at the end of the file are removed, so the last line with
+            text is kept until it is known that there is more text after it. """
+        lines = []
+        limit = chunk_lines
+        stack = [iter(self._tree)]
+        while stack:
+            for entry in stack[-1]:
+                lines.append(f"{entry['separator']}{entry['data']}\n")
+                if len(lines) >= limit:
+                    last_text = len(lines) - 1
+                    while (last_text > 0) and lines[last_text].isspace():
+                        last_text -= 1
+                    if last_text > 0:
+                        yield ''.join(lines[:last_text])
+                        del lines[:last_text]
+                    limit = len(lines) + chunk_lines
+                if entry['child']:
+                    stack.append(iter(entry['child']))
+                    break
+            else:
+                stack.pop()
+        yield ''.join(lines).rstrip() + '\n'
+
+    def write_yaml(self, output_file):
+        """ Writes the YAML file updated with the new versions into a file
+            object, without building the whole text in memory """
+        output_file.writelines(self.iter_yaml())
 
     def get_yaml(self) -> str:
         """ Returns the YAML file updated with the new versions """
-        data = self._get_yaml_group(self._tree)
-        data = data.rstrip()
-        if data[-1] != '\n':
-            data += '\n'
-        return data
-    
+        return ''.join(self.iter_yaml())
+
     def get_metadata(self) -> Optional[dict]:
         """ Returns metadata in form of list """
         data = []
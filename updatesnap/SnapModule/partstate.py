@@ -0,0 +1,70 @@
+""" Persistent state of the parts between runs. For each part, it records
+    the source, the current tag and the version format used, the
+    fingerprint of the upstream tags, and the result of the evaluation.
+    If none of them changed since the last run, the stored result is
+    still valid, and the tags don't need to be evaluated again. """
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from SnapModule.tag import Tag
+
+
+def _encode(element):
+    if isinstance(element, datetime.datetime):
+        return {"__datetime__": element.isoformat()}
+    if isinstance(element, Tag):
+        return {"__tag__": element.to_dict()}
+    raise TypeError(f"Object of type {type(element).__name__} is not JSON serializable")
+
+
+def _decode(element: dict):
+    if "__datetime__" in element:
+        return datetime.datetime.fromisoformat(element["__datetime__"])
+    if "__tag__" in element:
+        return Tag(**element["__tag__"])
+    return element
+
+
+class PartState:
+    """ Keeps the state of each part in a JSON file """
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as state_file:
+                self._entries = json.load(state_file, object_hook=_decode)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def get_key(snap_name: Optional[str], part: str) -> str:
+        """ Returns the key used to store a part of a snap """
+        return f"{snap_name}/{part}"
+
+    def get(self, key: str) -> Optional[dict]:
+        """ Returns the stored state of a part, or None if there isn't one """
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key: str, entry: dict):
+        """ Stores the state of a part. It is written to disk by save(). """
+        # check now that the entry can be stored, instead of failing in save()
+        entry = json.loads(json.dumps(entry, default=_encode), object_hook=_decode)
+        with self._lock:
+            self._entries[key] = entry
+
+    def save(self):
+        """ Writes the state of all the parts to the file """
+        folder = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder,
+                                             delete=False) as state_file:
+                json.dump(self._entries, state_file, default=_encode, indent=1)
+            os.replace(state_file.name, self._path)
@@ -0,0 +1,115 @@
+""" Scheduler that keeps the requests inside the rate limits of the
+    servers. It tracks the remaining budget announced by Github
+    (X-RateLimit-*) and Gitlab (RateLimit-*) for each host and token,
+    slows down the requests when the budget is low, and computes how long
+    to wait before retrying a failed request. """
+
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+
+class RateLimitScheduler:
+    """ Tracks the request budget of each host and token """
+    def __init__(self, low_budget: int = 20, max_retry_time: float = 300,
+                 base_delay: float = 1, max_delay: float = 60):
+        self._low_budget = low_budget
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self.max_retry_time = max_retry_time
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_header(response, names: list) -> Optional[str]:
+        for name in names:
+            if name in response.headers:
+                return response.headers[name]
+        return None
+
+    def wait(self, key: tuple):
+        """ Must be called before each request. If the budget of the host
+            and token is low, it spreads the remaining requests until the
+            reset time; if it is exhausted, it waits until the reset time,
+            or throws a ConnectionError if that is too far away. """
+        with self._lock:
+            if key not in self._budgets:
+                return
+            remaining, reset = self._budgets[key]
+            now = time.time()
+            if reset <= now:
+                del self._budgets[key]
+                return
+            # reserve one request, so other threads see the budget consumed
+            self._budgets[key] = (remaining - 1, reset)
+        if remaining <= 0:
+            delay = reset - now
+            if delay > self.max_retry_time:
+                raise ConnectionError(f"Rate limit exhausted for {key[0]} until "
+                                      f"{time.ctime(reset)}")
+        elif remaining < self._low_budget:
+            delay = min((reset - now) / remaining, self._max_delay)
+        else:
+            return
+        time.sleep(delay)
+
+    def update(self, key: tuple, response):
+        """ Updates the budget of a host and token with the rate limit
+            headers of a response """
+        remaining = self._get_header(response, ['X-RateLimit-Remaining', 'RateLimit-Remaining'])
+        reset = self._get_header(response, ['X-RateLimit-Reset', 'RateLimit-Reset'])
+        if (remaining is None) or (reset is None):
+            return
+        try:
+            budget = (int(remaining), float(reset))
+        except ValueError:
+            return
+        with self._lock:
+            self._budgets[key] = budget
+
+    @staticmethod
+    def _parse_retry_after(retry_after: str) -> Optional[float]:
+        """ Returns the seconds specified in a Retry-After header, which
+            can contain either a number of seconds or a date """
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+
+    def get_retry_delay(self, response, attempt: int = 0) -> Optional[float]:
+        """ Returns the seconds to wait before retrying a request, or None
+            if the response isn't due to the rate limit or to a temporary
+            error, and so the request must not be retried """
+        if response.status_code not in [403, 429, 503]:
+            return None
+        retry_after = self._get_header(response, ['Retry-After'])
+        if retry_after is not None:
+            return self._parse_retry_after(retry_after)
+        remaining = self._get_header(response, ['X-RateLimit-Remaining', 'RateLimit-Remaining'])
+        reset = self._get_header(response, ['X-RateLimit-Reset', 'RateLimit-Reset'])
+        if (remaining == '0') and (reset is not None) and reset.isdigit():
+            return max(0.0, float(reset) - time.time()) + 1
+        if response.status_code == 403:
+            # a real "forbidden" answer
+            return None
+        return self.get_backoff(attempt)
+
+    def get_backoff(self, attempt: int) -> float:
+        """ Returns the seconds to wait before a retry, growing exponentially
+            with the number of attempts, and with a random jitter to avoid
+            retrying all the requests at the same time """
+        delay = min(self._max_delay, self._base_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+
+_SCHEDULER = RateLimitScheduler()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    """ Returns the scheduler shared by all the GIT classes """
+    return _SCHEDULER
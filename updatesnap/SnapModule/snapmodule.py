@@ -1,21 +1,43 @@
 """ Processes a YAML file to get the list of available updates for
     each part, or return a new YAML with each part's version tag
     updated to the last version available in each source repository """
+# pylint: disable=too-many-lines
 
 import urllib
+import asyncio
 import base64
+import copy
 import re
 import time
 import os
 import datetime
+import hashlib
+import heapq
+import io
+import json
+import itertools
 import sys
-from typing import Optional
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional
 import requests
 import yaml
 
 import packaging.version
 import debian.debian_support
 
+from SnapModule.httpcache import HTTPCache
+from SnapModule.commitstore import CommitStore
+from SnapModule.manageYAML import ManageYAML, get_extended_yaml
+from SnapModule.httpsession import get_client
+from SnapModule.ratelimit import RateLimitScheduler, get_scheduler
+from SnapModule.upstreamindex import SharedTags, UpstreamIndex
+from SnapModule.partstate import PartState
+from SnapModule.versionformat import get_version_format, parse_version
+from SnapModule.tag import Tag
+from SnapModule.tagranking import TagRanking
+
 
 class Colors:
     # pylint: disable=too-few-public-methods
@@ -34,12 +56,12 @@ class Colors:
         self.all_ok = green
         self.note = cyan
 
-    def clear_line(self):
+    def clear_line(self, output=None):
         """ Restore the colors to the default ones
 
         This must be called after showing a piece of text with any of
         the previous colors, to go back to the default color."""
-        print(self.clearline, end="\r", file=sys.stderr)
+        print(self.clearline, end="\r", file=output or sys.stderr)
 
 
 class ProcessVersion:
@@ -48,11 +70,18 @@ class ProcessVersion:
 
     Implements the base code to parse a version number based on the
     version_format tag in a snapcraft.yaml file."""
+    # shared by all the objects, to avoid mixing the messages of several threads
+    _output_lock = threading.Lock()
+    # the output buffer of each thread, shared by all the objects, so the
+    # messages of the GIT backends go to the buffer of the part too
+    _thread_output = threading.local()
+
     def __init__(self, silent=False):
         super().__init__()
         self._silent = silent
         self._colors = Colors()
-        self._last_part = None
+        # the last part is kept for each thread
+        self._local = threading.local()
         self._error_list = []
         self._full_silent = False
 
@@ -72,30 +101,41 @@ class ProcessVersion:
         self._error_list.append(message)
         if self._full_silent:
             return
-        if part != self._last_part:
+        output = self._get_output()
+        if part != getattr(self._local, "last_part", None):
             print(f"Part: {self._colors.note}{part}{self._colors.reset}"
-                  f"{f' ({source})' if source else ''}", file=sys.stderr)
-            self._last_part = part
+                  f"{f' ({source})' if source else ''}", file=output)
+            self._local.last_part = part
         if message is not None:
-            print("  ", end="", file=sys.stderr)
+            print("  ", end="", file=output)
             if use_color is not None:
-                print(use_color, end="", file=sys.stderr)
-            print(message, end="", file=sys.stderr)
+                print(use_color, end="", file=output)
+            print(message, end="", file=output)
             if use_color is not None:
-                print(self._colors.reset, file=sys.stderr)
+                print(self._colors.reset, file=output)
         if extra_cr:
-            print("", file=sys.stderr)
-
-    @staticmethod
-    def _read_number(text):
-        number = 0
-        if (len(text) == 0) or (text[0] not in '0123456789'):
-            return None, text
-        while (len(text) > 0) and (text[0] in '0123456789'):
-            number *= 10
-            number += int(text[0])
-            text = text[1:]
-        return number, text
+            print("", file=output)
+
+    def _get_output(self):
+        """ Returns where the messages must be printed: the buffer of the
+            current thread, if there is one, or stderr """
+        return getattr(self._thread_output, "buffer", None) or sys.stderr
+
+    def _call_buffered(self, function, *args):
+        """ Calls a function keeping all the messages printed by it in a
+            buffer, and prints them together when it ends. This way, the
+            messages of functions running in parallel aren't mixed. """
+        self._thread_output.buffer = io.StringIO()
+        self._local.last_part = None
+        try:
+            return function(*args)
+        finally:
+            messages = self._thread_output.buffer.getvalue()
+            self._thread_output.buffer = None
+            if messages:
+                with self._output_lock:
+                    sys.stderr.write(messages)
+                    sys.stderr.flush()
 
     def _checkopt(self, option, dictionary):
         """ Returns True if an option is in the dictionary and it's True.
@@ -116,55 +156,35 @@ class ProcessVersion:
                                   "Missing tag version format for "
                                   f"{part_name}.")
             return None  # unknown format
+        version_format = get_version_format(entry_format['format'])
         # Check for variations in the version format and beta releases.
-        if '%V' in entry_format['format']:
-            if not entry.startswith(entry_format['format'].split('%')[0]):
+        if version_format.variation:
+            variation = version_format.get_variation(entry)
+            if variation is None:
                 return None
             try:
-                version = packaging.version.parse(
-                        entry[len(entry_format['format'].split('%')[0]):])
+                version = parse_version(variation)
                 if (("lower-than" in entry_format) and
-                        (version >= packaging.version.parse(
-                            str(entry_format["lower-than"])))):
+                        (version >= parse_version(str(entry_format["lower-than"])))):
                     return None
                 return version
             except packaging.version.InvalidVersion:
-                version = debian.debian_support.Version(
-                    entry[len(entry_format['format'].split('%')[0]):])
+                version = debian.debian_support.Version(variation)
                 if (("lower-than" in entry_format) and
                         (version >= debian.debian_support.Version(
                             str(entry_format["lower-than"])))):
                     return None
                 return version
-        major = 0
-        minor = 0
-        revision = 0
-        # space is "no element". Adding it in front of the first block simplifies the code
-        fmt = (" " + entry_format["format"]).split("%")
-        for part in fmt:
-            if part[0] != ' ':
-                number, entry = self._read_number(entry)
-                if number is None:
-                    return None  # not found a number when expected
-                match part[0]:
-                    case 'M':
-                        major = number
-                    case 'm':
-                        minor = number
-                    case 'R':
-                        revision = number
-            part = part[1:]
-            if len(part) == 0:
-                continue
-            if not entry.startswith(part):
-                return None
-            entry = entry[len(part):]
-        version = packaging.version.parse(f"{major}.{minor}.{revision}")
+        numbers = version_format.match(entry)
+        if numbers is None:
+            return None
+        major, minor, revision = numbers
+        version = parse_version(f"{major}.{minor}.{revision}")
 
         if "ignore-version" in entry_format:
             to_ignore = entry_format["ignore-version"]
             if isinstance(to_ignore, str):
-                if version == packaging.version.parse(to_ignore):
+                if version == parse_version(to_ignore):
                     return None
             elif isinstance(to_ignore, list):
                 for ignore_version in to_ignore:
@@ -173,7 +193,7 @@ class ProcessVersion:
                                    "contains an element that is not a string.")
                         self._print_error(part_name, self._colors.critical, message)
                         raise ValueError(message)
-                    if version == packaging.version.parse(ignore_version):
+                    if version == parse_version(ignore_version):
                         return None
             else:
                 message = (f"The 'ignore-version' entry in {part_name} is neither a string, "
@@ -182,7 +202,7 @@ class ProcessVersion:
                 raise ValueError(message)
 
         if (("lower-than" in entry_format) and
-                (version >= packaging.version.parse(str(entry_format["lower-than"])))):
+                (version >= parse_version(str(entry_format["lower-than"])))):
             return None
         if self._checkopt("ignore-odd-minor", entry_format) and ((minor % 2) == 1):
             return None
@@ -194,16 +214,25 @@ class ProcessVersion:
 
 
 class GitClass(ProcessVersion):
+    # pylint: disable=too-many-instance-attributes
     """ Base class to get access to a GIT repository
 
     Implements the base functionality to access a remote GIT repository,
     either Github or Gitlab type, and use a REST API to obtain data. """
+    # whether iter_tags() returns the tags from the newest to the oldest
+    tags_sorted_by_date = False
+
     def __init__(self, repo_type: str, silent=False):
         super().__init__(silent)
         self._token = None
         self._user = None
         self._repo_type = repo_type
-        self._current_tag = None
+        self._max_workers = 8
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._cache = None
+        self._commit_store = None
+        self._scheduler = get_scheduler()
 
     def set_secrets(self, secrets):
         """ Configure the secrets for this repository
@@ -220,66 +249,195 @@ class GitClass(ProcessVersion):
         elif secret == 'token':
             self._token = value
 
+    def set_max_workers(self, max_workers: int):
+        """ Sets the maximum number of requests that can be done
+            simultaneously against the remote repository """
+        with self._executor_lock:
+            self._max_workers = max(1, max_workers)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _submit(self, function, *args) -> Future:
+        """ Calls a function in the pool of workers of this backend. There
+            is a single pool for each backend, shared by all the parts that
+            use it, so the requests done simultaneously against the remote
+            repository are bounded by the maximum number of workers. """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix=self._repo_type)
+            executor = self._executor
+        # the workers print their messages in the buffer of the caller
+        buffer = getattr(self._thread_output, "buffer", None)
+
+        def call():
+            previous = getattr(self._thread_output, "buffer", None)
+            self._thread_output.buffer = buffer
+            try:
+                return function(*args)
+            finally:
+                self._thread_output.buffer = previous
+
+        return executor.submit(call)
+
+    def _map_concurrent(self, function, elements: list) -> list:
+        """ Calls the function with each element of the list using the
+            pool of workers, and returns the results in the same order
+            than the elements. """
+        if (self._max_workers <= 1) or (len(elements) <= 1):
+            return [function(element) for element in elements]
+        futures = [self._submit(function, element) for element in elements]
+        return [future.result() for future in futures]
+
+    def set_cache(self, cache: Optional[HTTPCache]):
+        """ Sets the cache used to store the responses and revalidate
+            them with conditional requests """
+        self._cache = cache
+
+    def set_commit_store(self, commit_store: Optional[CommitStore]):
+        """ Sets the store used to keep the commit data between runs """
+        self._commit_store = commit_store
+
+    def set_scheduler(self, scheduler: RateLimitScheduler):
+        """ Sets the scheduler that keeps the requests inside the rate limits """
+        self._scheduler = scheduler
+
     def _read_uri(self, uri: str):
-        # pylint: disable=bare-except
+        if self._cache is None:
+            return self._send_request("GET", uri)
+        key = f"{self._user}@{uri}"
+        cached = self._cache.get(key)
+        if cached is None:
+            response = self._send_request("GET", uri)
+        else:
+            response = self._send_request("GET", uri,
+                                          headers=self._cache.get_validators(cached))
+            if response.status_code == 304:
+                self._cache.hit(key)
+                return cached
+        self._cache.store(key, response)
+        return response
+
+    def _post_uri(self, uri: str, data: dict):
+        return self._send_request("POST", uri, data=data)
+
+    def _send_request(self, method: str, uri: str, data: Optional[dict] = None,
+                      headers: Optional[dict] = None):
         if not self._silent:
-            print(f"Asking URI {uri}     ", end="\r", file=sys.stderr)
+            print(f"Asking URI {uri}     ", end="\r", file=self._get_output())
+        auth = None
+        if (self._user is not None) and (self._token is not None):
+            auth = requests.auth.HTTPBasicAuth(self._user, self._token)
+        budget_key = (urllib.parse.urlparse(uri).netloc, self._token)
+        deadline = time.monotonic() + self._scheduler.max_retry_time
+        attempt = 0
         while True:
+            self._scheduler.wait(budget_key)
             try:
-                if (self._user is not None) and (self._token is not None):
-                    response = requests.get(uri, auth=requests.auth.HTTPBasicAuth(
-                                            self._user, self._token), timeout=30)
-                else:
-                    response = requests.get(uri, timeout=30)
-                break
-            except (requests.ConnectionError, requests.Timeout):
-                if not self._silent:
-                    print(f"Retrying URI {uri}     ", end="\r", file=sys.stderr)
-                time.sleep(1)
-        return response
+                response = get_client(retries=False).request(method, uri, json=data,
+                                                             headers=headers, auth=auth)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                delay = self._scheduler.get_backoff(attempt)
+                error = str(exception)
+            else:
+                self._scheduler.update(budget_key, response)
+                delay = self._scheduler.get_retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                error = f"status code {response.status_code}"
+            attempt += 1
+            if time.monotonic() + delay > deadline:
+                raise ConnectionError(f"Failed to get {uri} after {attempt} attempts: {error}")
+            if not self._silent:
+                print(f"Retrying URI {uri}     ", end="\r", file=self._get_output())
+            time.sleep(delay)
 
-    def _stop_download(self, data):
-        # pylint: disable=unused-argument
-        return False
+    @staticmethod
+    def _get_links(headers) -> dict:
+        """ Returns the URIs of the Link header, indexed by their 'rel' value """
+        links = {}
+        if "Link" not in headers:
+            return links
+        for entry in headers["link"].split(","):
+            rel = re.search('rel="([^"]*)"', entry)
+            p_left = entry.find("<")
+            p_right = entry.find(">")
+            if (rel is None) or (p_left == -1) or (p_right == -1):
+                continue
+            links[rel.group(1)] = entry[p_left+1:p_right]
+        return links
+
+    @staticmethod
+    def _get_page_uris(links: dict, count: int) -> list:
+        """ Returns the URIs of the next 'count' pages. They can be built only
+            if the Link header includes the last page; if not, only the URI
+            of the next page is returned. """
+        if "next" not in links:
+            return []
+        if "last" not in links:
+            return [links["next"]]
+        next_uri = urllib.parse.urlparse(links["next"])
+        next_query = urllib.parse.parse_qsl(next_uri.query)
+        last_query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(links["last"]).query))
+        next_page = dict(next_query).get("page", "")
+        last_page = last_query.get("page", "")
+        if (not next_page.isdigit()) or (not last_page.isdigit()):
+            return [links["next"]]
+        uris = []
+        for page in range(int(next_page), min(int(last_page), int(next_page) + count - 1) + 1):
+            query = [(key, str(page) if key == "page" else value) for key, value in next_query]
+            uris.append(next_uri._replace(query=urllib.parse.urlencode(query)).geturl())
+        return uris
+
+    def _iter_pages(self, uri: str) -> Iterator[list]:
+        """ Iterates over the pages of a paginated request. If the Link
+            header includes the last page, the next pages are read in
+            parallel, keeping as many pages requested as workers: each time
+            the caller asks for a page, the next one is requested, so a slow
+            page doesn't stop the ones after it. The caller can stop the
+            iteration at any moment, and no more pages will be requested. """
+        uris = deque([uri])
+        pending = deque()
+        try:
+            while (len(uris) != 0) or (len(pending) != 0):
+                if (len(pending) == 0) and ((len(uris) == 1) or (self._max_workers <= 1)):
+                    # nothing to do in parallel
+                    data, headers = self._read_page_with_headers(uris.popleft())
+                else:
+                    while (len(uris) != 0) and (len(pending) < self._max_workers):
+                        pending.append(self._submit(self._read_page_with_headers,
+                                                    uris.popleft()))
+                    data, headers = pending.popleft().result()
+                if (len(uris) == 0) and (len(pending) == 0):
+                    # the URIs known are exhausted; this page tells the next ones
+                    uris.extend(self._get_page_uris(self._get_links(headers), sys.maxsize))
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
+        if not self._silent:
+            self._colors.clear_line(self._get_output())
 
     def _read_pages(self, uri: str) -> Optional[list]:
+        """ Reads all the pages of a paginated request """
         elements = []
-        while uri is not None:
-            response = self._read_uri(uri)
-            if response.status_code != 200:
-                message = f"Status code {response.status_code} when asking for {uri}"
-                if not self._silent:
-                    print(f"{self._colors.critical}{message}{self._colors.reset}", file=sys.stderr)
-                raise ConnectionError(message)
-            headers = response.headers
-            data = response.json()
-            for entry in data:
-                elements.append(entry)
-            if self._stop_download(data):
-                break
-            uri = None
-            if "Link" in headers:
-                link = headers["link"]
-                entries = link.split(",")
-                for entry in entries:
-                    if 'rel="next"' not in entry:
-                        continue
-                    p_left = entry.find("<")
-                    p_right = entry.find(">")
-                    uri = entry[p_left+1:p_right]
-                    break
-        if not self._silent:
-            self._colors.clear_line()
+        for data in self._iter_pages(uri):
+            elements += data
         return elements
 
-    def _read_page(self, uri: str) -> Optional[dict]:
+    def _read_page_with_headers(self, uri: str) -> tuple:
         response = self._read_uri(uri)
         if response.status_code != 200:
             message = f"Status code {response.status_code} when asking for {uri}"
             if not self._silent:
-                print(f"{self._colors.critical}{message}{self._colors.reset}", file=sys.stderr)
+                print(f"{self._colors.critical}{message}{self._colors.reset}",
+                      file=self._get_output())
             raise ConnectionError(message)
-        data = response.json()
+        return response.json(), response.headers
+
+    def _read_page(self, uri: str) -> Optional[dict]:
+        data, _ = self._read_page_with_headers(uri)
         return data
 
     def _get_uri(self, repository, min_elements):
@@ -293,12 +451,12 @@ class GitClass(ProcessVersion):
         elements = uri.path.split("/")
         if uri.scheme not in ['http', 'https', 'git']:
             message = f"Unrecognized protocol in repository {repository}"
-            print(f"{self._colors.critical}{message}{self._colors.reset}", file=sys.stderr)
+            print(f"{self._colors.critical}{message}{self._colors.reset}", file=self._get_output())
             raise ValueError(message)
         elements = uri.path.split("/")
         if len(elements) < min_elements:
             message = f"Invalid uri format for repository {repository}"
-            print(f"{self._colors.critical}{message}{self._colors.reset}", file=sys.stderr)
+            print(f"{self._colors.critical}{message}{self._colors.reset}", file=self._get_output())
             raise ValueError(message)
         return uri
 
@@ -325,6 +483,95 @@ class GitClass(ProcessVersion):
             output += '/' + element
         return output
 
+    def _parse_tag_versions(self, names: list, version_format: Optional[dict]) -> list:
+        """ Returns the version of each tag in a list, or None for those
+            that don't follow the format, so they are parsed only once """
+        if not version_format:
+            return [None] * len(names)
+        return [self._get_version("", name, version_format, False) for name in names]
+
+    def iter_tags(self, repository: str, current_tag=None,
+                  version_format=None) -> Optional[Iterator[Tag]]:
+        """ Returns an iterator over the tags of this repository, or None
+            if the repository isn't of this type. The tags are downloaded
+            only when they are reached, and, if the backend returns them
+            from the newest to the oldest, the iteration ends at the
+            current tag. Implemented by each backend. """
+        # pylint: disable=unused-argument
+        return None
+
+    def get_tags(self, repository: str, current_tag=None,
+                 version_format=None) -> Optional[list]:
+        """ Returns a list of tags for this repository, or None if the
+            repository isn't of this type. If none of the tags follows the
+            version format, the list is empty. """
+        # pylint: disable=assignment-from-none
+        tags = self.iter_tags(repository, current_tag, version_format)
+        if tags is None:
+            return None
+        return list(tags)
+
+    def probe_tags(self, repository: str, previous: Optional[dict] = None) -> Optional[dict]:
+        """ Does the cheapest request that allows to know whether the tags
+            of this repository changed, and returns a dictionary with the
+            fingerprint of the tags and the validators to repeat the request
+            as a conditional one. If the previous probe is still valid, it
+            is returned. Returns None if the repository isn't of this type.
+            Implemented by each backend. """
+        # pylint: disable=unused-argument
+        return None
+
+    def _probe_uri(self, uri: str, previous: Optional[dict]) -> dict:
+        """ Asks for an URI using the validators of the previous probe, so
+            if it didn't change, the server answers with a '304 Not Modified' """
+        headers = previous["validators"] if previous else None
+        response = self._send_request("GET", uri, headers=headers or None)
+        if (response.status_code == 304) and (previous is not None):
+            return previous
+        if response.status_code != 200:
+            raise ConnectionError(f"Status code {response.status_code} when asking for {uri}")
+        return {"fingerprint": hashlib.sha256(response.content).hexdigest(),
+                "validators": HTTPCache.get_validators(response)}
+
+    def get_branches(self, repository: str) -> Optional[list]:
+        """ Returns a list of branches for this repository, or None if the
+            repository isn't of this type. Implemented by each backend. """
+        # pylint: disable=unused-argument
+        return None
+
+    def get_recent_branches(self, repository: str, branch: Optional[str] = None,
+                            count: int = 4) -> Optional[list]:
+        """ Returns the 'count' most recent branches and, if a branch is
+            set, that branch and all the branches updated after it, reading
+            only the branches needed. Returns None if the repository isn't
+            of this type, or if the backend can't do it; in that case,
+            get_branches() must be used. """
+        # pylint: disable=unused-argument
+        return None
+
+    def get_file(self, repository: str, file_path: str) -> Optional[bytes]:
+        """ Returns the contents of a file of the repository, or None if
+            the backend doesn't support it. """
+        # pylint: disable=unused-argument
+        return None
+
+    async def get_tags_async(self, repository: str, current_tag=None,
+                             version_format=None) -> Optional[list]:
+        """ Asynchronous version of get_tags(). The requests are still
+            blocking: they are done in a worker thread, so they don't block
+            the event loop, but each call uses a thread while it waits. """
+        return await asyncio.to_thread(self.get_tags, repository, current_tag, version_format)
+
+    async def get_branches_async(self, repository: str) -> Optional[list]:
+        """ Asynchronous version of get_branches(), done in a worker thread
+            like get_tags_async() """
+        return await asyncio.to_thread(self.get_branches, repository)
+
+    async def get_file_async(self, repository: str, file_path: str) -> Optional[bytes]:
+        """ Asynchronous version of get_file(), done in a worker thread
+            like get_tags_async() """
+        return await asyncio.to_thread(self.get_file, repository, file_path)
+
 
 class Github(GitClass):
     """ Implements access to Github GIT repositories """
@@ -335,10 +582,10 @@ class Github(GitClass):
     def _is_github(self, repository: str):
         """ Evaluates the URI of a repository and returns an URI
             object with it, but only if it is a Github URI. """
-        uri = self._get_uri(repository, 3)
+        uri = self._get_uri(repository, 1)
         if uri.netloc not in ["github.com", "www.github.com"]:
             return None
-        return uri
+        return self._get_uri(repository, 3)
 
     def get_branches(self, repository: str) -> Optional[list]:
         """ Returns a list of branches for this repository """
@@ -348,49 +595,73 @@ class Github(GitClass):
         branch_command = self.join_url(self._api_url, uri.path, 'branches')
         return self._read_pages(branch_command)
 
-    def _stop_download(self, data) -> bool:
-        if self._current_tag is None:
-            return False
-        for entry in data:
-            if ('name' in entry) and (self._current_tag == entry['name']):
-                return True
-        return False
-
-    def get_tags(self, repository: str, current_tag=None,
-                 version_format=None) -> Optional[list]:
-        """ Returns a list of tags for this repository """
-        if version_format is None:
-            version_format = {}
+    def iter_tags(self, repository: str, current_tag=None,
+                  version_format=None) -> Optional[Iterator[Tag]]:
+        """ Returns an iterator over the tags of this repository. Without
+            a version format, all the tags are returned. """
         uri = self._is_github(repository)
         if uri is None:
             return None
+        return self._iter_rest_tags(uri, current_tag, version_format)
 
-        self._current_tag = current_tag
-        tag_command = self.join_url(self._rb(self._api_url), self._rb(uri.path),
-                                    'tags?sort=created&direction=desc')
-        data = self._read_pages(tag_command)
-        if not data:
+    def _get_tags_uri(self, uri) -> str:
+        return self.join_url(self._rb(self._api_url), self._rb(uri.path),
+                             'tags?sort=created&direction=desc')
+
+    def probe_tags(self, repository: str, previous: Optional[dict] = None) -> Optional[dict]:
+        """ Github ignores the sort order of the tags, so a new tag can be in
+            any page, and the first one isn't enough to know whether they
+            changed. Github also serves the reference advertisement, with
+            all the tags, so GitSmartHTTP does the probe instead. """
+        # pylint: disable=unused-argument
+        return None
+
+    def _iter_rest_tags(self, uri, current_tag, version_format) -> Iterator[Tag]:
+        """ Yields the tags with a valid version (or all of them, if there
+            is no version format), until the current one. The dates need a
+            request for each tag, so they are resolved in parallel, in
+            groups of as many tags as workers, only when the group is
+            reached. """
+        repository_key = f"{uri.netloc}{uri.path}".lower()
+        for data in self._iter_pages(self._get_tags_uri(uri)):
+            candidates = []
+            found_current = False
+            versions = self._parse_tag_versions([tag['name'] for tag in data], version_format)
+            for tag, version in zip(data, versions):
+                if (version is not None) or (version_format is None):
+                    candidates.append((tag, version))
+                if (current_tag is not None) and (current_tag == tag['name']):
+                    found_current = True
+                    break
+            for start in range(0, len(candidates), self._max_workers):
+                group = candidates[start:start + self._max_workers]
+                dates = self._map_concurrent(
+                    lambda candidate: self._get_tag_date(repository_key, candidate[0]), group)
+                for (tag, version), date in zip(group, dates):
+                    if date is not None:
+                        yield Tag(tag['name'], date, tag['commit'].get('sha'), version)
+            if found_current:
+                return
+
+    def _get_tag_date(self, repository_key: str, tag: dict) -> Optional[datetime.datetime]:
+        """ Returns the date of the commit pointed by a tag. The commit
+            store is checked first, so only new commits are downloaded. """
+        sha = tag['commit'].get('sha')
+        if (self._commit_store is not None) and (sha is not None):
+            date = self._commit_store.get_date(repository_key, sha)
+            if date is not None:
+                return date
+        tag_info = self._read_page(tag['commit']['url'])
+        if tag_info is None:
             return None
-        tags = []
-        self._current_tag = None
-        for tag in data:
-            parsed_version = self._get_version("", tag['name'], version_format, False)
-            if parsed_version is None:
-                continue
-            tag_info = self._read_page(tag['commit']['url'])
-            if tag_info is None:
-                continue
-            if 'commiter' in tag_info['commit']:
-                date = tag_info['commit']['committer']['date']
-            else:
-                date = tag_info['commit']['author']['date']
-            tags.append({"name": tag['name'],
-                         "date": datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%SZ")})
-            if (current_tag is not None) and (current_tag == tag['name']):
-                break
-        if not self._silent:
-            self._colors.clear_line()
-        return tags
+        if 'commiter' in tag_info['commit']:
+            date = tag_info['commit']['committer']['date']
+        else:
+            date = tag_info['commit']['author']['date']
+        date = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%SZ")
+        if (self._commit_store is not None) and (sha is not None):
+            self._commit_store.set_date(repository_key, sha, date)
+        return date
 
     def get_file(self, repository: str, file_path: str) -> Optional[bytes]:
         """ Returns a json with the contents of a file of the repository """
@@ -406,21 +677,117 @@ class Github(GitClass):
         return base64.b64decode(data['content'])
 
 
+class GithubGraphQL(Github):
+    """ Implements access to Github GIT repositories using the GraphQL API
+
+    The REST API requires one request for each page of 30 tags, and
+    another one for each tag to know its date. The GraphQL API returns
+    the name, the commit and the date of 100 tags in a single request.
+    It requires an user and a token; without them, it falls back to the
+    REST API. """
+    _TAGS_QUERY = """
+        query($owner: String!, $name: String!, $cursor: String) {
+            repository(owner: $owner, name: $name) {
+                refs(refPrefix: "refs/tags/", first: 100, after: $cursor,
+                     orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+                    pageInfo { hasNextPage endCursor }
+                    nodes {
+                        name
+                        target {
+                            oid
+                            ... on Commit { committedDate }
+                            ... on Tag { target { oid ... on Commit { committedDate } } }
+                        }
+                    }
+                }
+            }
+        }"""
+
+    def __init__(self, silent=False, graphql_url='https://api.github.com/graphql'):
+        super().__init__(silent)
+        self._graphql_url = graphql_url
+
+    def _read_graphql(self, query: str, variables: dict) -> dict:
+        response = self._post_uri(self._graphql_url, {"query": query, "variables": variables})
+        if response.status_code != 200:
+            message = f"Status code {response.status_code} when asking for {self._graphql_url}"
+            if not self._silent:
+                print(f"{self._colors.critical}{message}{self._colors.reset}",
+                      file=self._get_output())
+            raise ConnectionError(message)
+        data = response.json()
+        if "errors" in data:
+            message = f"Error when asking for {self._graphql_url}: {data['errors'][0]['message']}"
+            if not self._silent:
+                print(f"{self._colors.critical}{message}{self._colors.reset}",
+                      file=self._get_output())
+            raise ConnectionError(message)
+        return data["data"]
+
+    @property
+    def tags_sorted_by_date(self) -> bool:
+        """ The tags are sorted by date only when using GraphQL """
+        return (self._user is not None) and (self._token is not None)
+
+    def iter_tags(self, repository: str, current_tag=None,
+                  version_format=None) -> Optional[Iterator[Tag]]:
+        """ Returns an iterator over the tags of this repository """
+        if (self._user is None) or (self._token is None):
+            return super().iter_tags(repository, current_tag, version_format)
+        uri = self._is_github(repository)
+        if uri is None:
+            return None
+        return self._iter_graphql_tags(repository, uri, current_tag, version_format)
+
+    def _iter_graphql_tags(self, repository, uri, current_tag,
+                           version_format) -> Iterator[Tag]:
+        elements = uri.path.split("/")
+        variables = {"owner": elements[1], "name": elements[2], "cursor": None}
+        while variables is not None:
+            data = self._read_graphql(self._TAGS_QUERY, variables)
+            if data["repository"] is None:
+                raise ConnectionError(f"Repository {repository} not found")
+            refs = data["repository"]["refs"]
+            variables["cursor"] = refs["pageInfo"]["endCursor"]
+            if not refs["pageInfo"]["hasNextPage"]:
+                variables = None
+            versions = self._parse_tag_versions([node['name'] for node in refs["nodes"]],
+                                                version_format)
+            for node, version in zip(refs["nodes"], versions):
+                target = node["target"]
+                if "committedDate" not in target:
+                    # annotated tag: the commit is the target of the tag object
+                    target = target.get("target", {})
+                if "committedDate" not in target:
+                    continue
+                if (version is None) and (version_format is not None):
+                    continue
+                yield Tag(node["name"],
+                          datetime.datetime.strptime(target["committedDate"],
+                                                     "%Y-%m-%dT%H:%M:%SZ"),
+                          target["oid"], version)
+                if (current_tag is not None) and (current_tag == node['name']):
+                    variables = None
+                    break
+        if not self._silent:
+            self._colors.clear_line(self._get_output())
+
+
 class Gitlab(GitClass):
     """ Implements access to Gitlab GIT repositories """
+    tags_sorted_by_date = True
+
     def __init__(self, silent=False):
         super().__init__("gitlab", silent)
 
     def _is_gitlab(self, repository):
         """ Evaluates the URI of a repository and returns an URI
             object with it, but only if it is a Gitlab URI. """
-        uri = self._get_uri(repository, 3)
+        uri = self._get_uri(repository, 1)
         # Check for gitlab instance used by debian
-        if "salsa" in uri.netloc:
-            return uri
-        if "gitlab" not in uri.netloc:
+        if ("salsa" not in uri.netloc) and ("gitlab" not in uri.netloc):
             return None
-        return uri
+        return self._get_uri(repository, 3)
 
     @staticmethod
     def _project_name(uri):
@@ -429,67 +796,238 @@ class Gitlab(GitClass):
             name = name[1:]
         return name.replace('/', '%2F')
 
+    def _get_branches_uri(self, uri) -> str:
+        return self.join_url(uri.scheme + '://', uri.netloc, 'api/v4/projects',
+                             self._project_name(uri), 'repository/branches')
+
+    @staticmethod
+    def _get_branch_element(branch: dict) -> dict:
+        """ Returns the name and the date of a branch. The date is kept as
+            a datetime, because Gitlab returns it with the offset of its
+            timezone, so it can't be compared as text. """
+        element = {"name": branch['name']}
+        if "commited_date" in branch["commit"]:
+            element["date"] = Gitlab._parse_branch_date(branch["commit"]["commited_date"])
+        elif "created_at" in branch["commit"]:
+            element["date"] = Gitlab._parse_branch_date(branch["commit"]["created_at"])
+        else:
+            element["date"] = None
+        return element
+
+    @staticmethod
+    def _parse_branch_date(date) -> Optional[datetime.datetime]:
+        """ Returns the date of a branch as a datetime, or None if it isn't
+            valid """
+        if not isinstance(date, str):
+            return None
+        try:
+            date = datetime.datetime.fromisoformat(date.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date
+
     def get_branches(self, repository) -> Optional[list]:
         """ Returns a list of branches for this repository """
         uri = self._is_gitlab(repository)
         if uri is None:
             return None
 
-        branch_command = self.join_url(uri.scheme + '://', uri.netloc, 'api/v4/projects',
-                                       self._project_name(uri), 'repository/branches')
-        data = self._read_pages(branch_command)
+        data = self._read_pages(self._get_branches_uri(uri))
         if not data:
             return None
+        return [self._get_branch_element(branch) for branch in data]
+
+    def get_recent_branches(self, repository: str, branch: Optional[str] = None,
+                            count: int = 4) -> Optional[list]:
+        """ Asks for the head of the branch, if set, and then reads the
+            branches sorted by date, from the newest, until reaching the
+            ones older than it. Usually it needs only one or two requests. """
+        uri = self._is_gitlab(repository)
+        if uri is None:
+            return None
+        head = None
+        head_date = None
+        if branch is not None:
+            try:
+                head = self._read_page(self.join_url(self._get_branches_uri(uri),
+                                                     urllib.parse.quote(branch, safe='')))
+            except ConnectionError:
+                # the branch doesn't exist; the full list is needed to report it
+                return None
+            head = self._get_branch_element(head)
+            head_date = head["date"]
+            if head_date is None:
+                return None
         branches = []
-        for branch in data:
-            element = {"name": branch['name']}
-            if "commited_date" in branch["commit"]:
-                element["date"] = branch["commit"]["commited_date"]
-            elif "created_at" in branch["commit"]:
-                element["date"] = branch["commit"]["created_at"]
-            else:
-                element["date"] = 0
+        pages = self._iter_pages(self._get_branches_uri(uri) + '?sort=updated_desc')
+        for element in itertools.chain.from_iterable(pages):
+            element = self._get_branch_element(element)
+            date = element["date"]
+            if date is None:
+                return None
+            # the next ones are older, so they are neither newer nor recent
+            if (len(branches) >= count) and ((head is None) or (date < head_date)):
+                break
             branches.append(element)
-
+        if (head is not None) and (head["name"] not in [entry["name"] for entry in branches]):
+            branches.append(head)
         return branches
 
-    def _stop_download(self, data):
-        if self._current_tag is None:
-            return False
-        for entry in data:
-            if ('name' in entry) and (self._current_tag == entry['name']):
-                return True
-        return False
+    def iter_tags(self, repository: str, current_tag=None,
+                  version_format=None) -> Optional[Iterator[Tag]]:
+        """ Returns an iterator over the tags of this repository """
+        uri = self._is_gitlab(repository)
+        if uri is None:
+            return None
+        return self._iter_rest_tags(self._get_tags_uri(uri), current_tag, version_format)
 
-    def get_tags(self, repository, current_tag=None, version_format=None) -> Optional[list]:
-        # pylint: disable=unused-argument
-        """ Returns a list of tags for this repository """
+    def _get_tags_uri(self, uri) -> str:
+        return self.join_url(uri.scheme + '://', uri.netloc, 'api/v4/projects',
+                             self._project_name(uri),
+                             'repository/tags?order_by=updated&sort=desc')
+
+    def probe_tags(self, repository: str, previous: Optional[dict] = None) -> Optional[dict]:
+        """ Probes the first page of tags, where the new tags appear """
         uri = self._is_gitlab(repository)
         if uri is None:
             return None
+        return self._probe_uri(self._get_tags_uri(uri), previous)
+
+    def _iter_rest_tags(self, tag_command, current_tag, version_format) -> Iterator[Tag]:
+        """ Yields the tags until the end of the page with the current one.
+            They are sorted by the date of the tag, not of the commit, so
+            the tags after the current one in that page are also kept. """
+        for data in self._iter_pages(tag_command):
+            found_current = False
+            versions = self._parse_tag_versions([tag['name'] for tag in data], version_format)
+            for tag, version in zip(data, versions):
+                yield Tag(tag['name'],
+                          datetime.datetime.fromisoformat(tag['commit']['committed_date']),
+                          tag['commit'].get('id'), version)
+                if (current_tag is not None) and (current_tag == tag['name']):
+                    found_current = True
+            if found_current:
+                return
+
+
+class GitSmartHTTP(GitClass):
+    """ Implements access to any GIT repository served with the smart HTTP
+        protocol (cgit, git.launchpad.net, Savannah...)
+
+    It reads the reference advertisement returned by
+    info/refs?service=git-upload-pack, which contains all the tags and
+    branches, with their SHAs, in a single request, without using any
+    API quota. It doesn't contain the commit dates, so they are None. """
+    def __init__(self, silent=False):
+        super().__init__("git", silent)
+
+    def _get_refs_uri(self, repository: str) -> str:
+        uri = self._get_uri(repository, 2)
+        if uri.scheme == 'git':
+            # most servers with the GIT protocol also serve smart HTTP
+            uri = uri._replace(scheme='https')
+        path = uri.path
+        if repository.strip().endswith('.git'):
+            path += '.git'
+        return uri._replace(path=self.join_url(path, 'info/refs'),
+                            query='service=git-upload-pack').geturl()
 
-        self._current_tag = current_tag
-        tag_command = self.join_url(uri.scheme + '://', uri.netloc, 'api/v4/projects',
-                                    self._project_name(uri),
-                                    'repository/tags?order_by=updated&sort=desc')
-        data = self._read_pages(tag_command)
-        if data is None:
+    @staticmethod
+    def _parse_refs(content: bytes) -> dict:
+        """ Parses a reference advertisement in pkt-line format and returns
+            a dictionary with the SHA of each reference. For annotated tags,
+            the SHA is the one of the commit, taken from the peeled entry. """
+        refs = {}
+        position = 0
+        while position + 4 <= len(content):
+            try:
+                length = int(content[position:position + 4], 16)
+            except ValueError as exception:
+                raise ConnectionError("Invalid reference advertisement") from exception
+            if length < 4:
+                # flush packet
+                position += 4
+                continue
+            line = content[position + 4:position + length]
+            position += length
+            line = line.split(b'\0')[0].rstrip(b'\n').decode('utf-8', errors='replace')
+            if line.startswith('#') or (' ' not in line):
+                continue
+            sha, name = line.split(' ', 1)
+            if name.endswith('^{}'):
+                name = name[:-3]
+            refs[name] = sha
+        return refs
+
+    def get_refs(self, repository: str) -> Optional[dict]:
+        """ Returns a dictionary with the SHA of each reference of the
+            repository, or None if the server doesn't support the smart
+            HTTP protocol. """
+        uri = self._get_refs_uri(repository)
+        response = self._read_uri(uri)
+        if response.status_code != 200:
+            message = f"Status code {response.status_code} when asking for {uri}"
+            if not self._silent:
+                print(f"{self._colors.critical}{message}{self._colors.reset}",
+                      file=self._get_output())
+            raise ConnectionError(message)
+        if not self._silent:
+            self._colors.clear_line(self._get_output())
+        content_type = response.headers.get('Content-Type', '')
+        if content_type != 'application/x-git-upload-pack-advertisement':
             return None
-        tags = []
-        for tag in data:
-            tags.append({"name": tag['name'],
-                         "date": datetime.datetime.fromisoformat(tag['commit']['committed_date'])})
-        self._colors.clear_line()
-        return tags
+        return self._parse_refs(response.content)
+
+    def _get_refs_with_prefix(self, repository: str, prefix: str) -> Optional[list]:
+        refs = self.get_refs(repository)
+        if refs is None:
+            return None
+        return [{"name": name[len(prefix):], "sha": sha, "date": None}
+                for name, sha in refs.items() if name.startswith(prefix)]
+
+    def probe_tags(self, repository: str, previous: Optional[dict] = None) -> Optional[dict]:
+        """ Probes the reference advertisement. Only the tags are used for
+            the fingerprint, so new commits in the branches are ignored. """
+        tags = self._get_refs_with_prefix(repository, 'refs/tags/')
+        if tags is None:
+            return None
+        tag_list = sorted([tag["name"], tag["sha"]] for tag in tags)
+        return {"fingerprint": hashlib.sha256(json.dumps(tag_list).encode('utf-8')).hexdigest(),
+                "validators": {}}
+
+    def iter_tags(self, repository: str, current_tag=None,
+                  version_format=None) -> Optional[Iterator[Tag]]:
+        # pylint: disable=unused-argument
+        """ Returns an iterator over the tags of this repository. All of
+            them are read in a single request, and they aren't sorted, so
+            the iteration doesn't end at the current tag. """
+        tags = self._get_refs_with_prefix(repository, 'refs/tags/')
+        if tags is None:
+            return None
+        versions = self._parse_tag_versions([tag["name"] for tag in tags], version_format)
+        return iter([Tag(tag["name"], None, tag["sha"], version)
+                     for tag, version in zip(tags, versions)])
+
+    def get_branches(self, repository: str) -> Optional[list]:
+        """ Returns a list of branches for this repository """
+        return self._get_refs_with_prefix(repository, 'refs/heads/')
 
 
 class Snapcraft(ProcessVersion):
+    # pylint: disable=too-many-instance-attributes
     """ Implements all the YAML processing for snapcraft configuration files """
-    def __init__(self, silent, github_pose=None, gitlab_pose=None):
+    def __init__(self, silent, github_pose=None, gitlab_pose=None, git_pose=None):
         super().__init__(silent)
         self._secrets = {}
         self._config = None
+        self._results = {}
         self._tag_error = False
+        self._jobs = 1
+        self._index = UpstreamIndex()
+        self._state = None
+        self._part_listener = None
         if github_pose:
             self._github = github_pose
         else:
@@ -498,11 +1036,48 @@ class Snapcraft(ProcessVersion):
             self._gitlab = gitlab_pose
         else:
             self._gitlab = Gitlab(silent)
+        if git_pose:
+            self._git = git_pose
+        else:
+            self._git = GitSmartHTTP(silent)
 
     def set_full_silent(self):
         super().set_full_silent()
         self._github.set_full_silent()
         self._gitlab.set_full_silent()
+        self._git.set_full_silent()
+
+    def set_cache(self, cache: Optional[HTTPCache]):
+        """ Sets the HTTP cache used by all the backends """
+        self._github.set_cache(cache)
+        self._gitlab.set_cache(cache)
+        self._git.set_cache(cache)
+
+    def set_commit_store(self, commit_store: Optional[CommitStore]):
+        """ Sets the commit store used by all the backends """
+        self._github.set_commit_store(commit_store)
+        self._gitlab.set_commit_store(commit_store)
+        self._git.set_commit_store(commit_store)
+
+    def set_jobs(self, jobs: int):
+        """ Sets how many parts are processed in parallel """
+        self._jobs = max(1, jobs)
+
+    def set_index(self, index: UpstreamIndex):
+        """ Sets the index of upstream data, to share it between several
+            Snapcraft objects """
+        self._index = index
+
+    def set_state(self, state: Optional[PartState]):
+        """ Sets the state of the parts from the previous run, to evaluate
+            again only the parts whose upstream tags changed """
+        self._state = state
+
+    def set_part_listener(self, listener):
+        """ Sets a function that is called as soon as each part ends, with
+            the name of the snap, the name of the part, the result of
+            process_part() and the seconds that it took """
+        self._part_listener = listener
 
     def set_secret(self, backend, key, value):
         """ Sets an specific secret value for a backend """
@@ -542,6 +1117,22 @@ class Snapcraft(ProcessVersion):
             self._secrets = yaml.safe_load(secrets)
             self._github.set_secrets(self._secrets)
             self._gitlab.set_secrets(self._secrets)
+            self._git.set_secrets(self._secrets)
+
+    def load_manage_yaml(self, manager_yaml: ManageYAML, secrets=None):
+        """ process SNAPCRAFT.YAML data already loaded in a ManageYAML object,
+            and SECRETS. The parts keep the same names than in the object,
+            so the entries of each one can be found with get_part_entry(). """
+
+        self._load_secrets(None)
+        self._config, has_extensions = manager_yaml.get_config("updatesnap")
+        if has_extensions:
+            self._check_extensions_are_right()
+        if secrets:
+            self._secrets = yaml.safe_load(secrets)
+            self._github.set_secrets(self._secrets)
+            self._gitlab.set_secrets(self._secrets)
+            self._git.set_secrets(self._secrets)
 
     def _check_extensions_are_right(self):
         for part_name in self._config["parts"]:
@@ -557,94 +1148,187 @@ class Snapcraft(ProcessVersion):
                                  "a dictionary.")
 
     def _open_yaml_file_with_extensions(self, data, ext_name):
-        """ This method receives a YAML file content, explores it searching for a comment
-            with the text '# ext:ext_name' (being 'ext_name' the parameter
-            passed to the method), and it will include all the comments that
-            follow it replacing the '#' with a blank space, until it finds
-            another comment with the text '# endext', or with a non-comment
-            line. This allows to add extra fields in a YAML file without
-            breaking compatibility with snapcraft, because, by replacing
-            the # with an space, the format is preserved.
-
-            The 'ext_name' part allows to add in a file blocks for several
-            different programs without they interferring with others. This
-            way, program1 can enable only the blocks marked with '# ext:program1',
-            while program2 can enable only the blocks marked with '# ext:program2',
-            for example, thus allowing to just reuse this method."""
-
-        newfile = ""
-        replace_comments = False
-        has_extensions = False
-        for line in data.split("\n"):
-            line += '\n'  # restore the newline at the end
-            if line[0] != '#':
-                newfile += line
-                replace_comments = False
-                continue
-            # the line contains a valid comment
-            if line == f'# ext:{ext_name}\n':
-                has_extensions = True
-                replace_comments = True
-                continue
-            if line == '# endext\n':
-                replace_comments = False
-                continue
-            if replace_comments:
-                line = line[1:]
-                if (len(line) > 0) and (line[1] == ' '):
-                    line = ' ' + line
-                else:
-                    line = '#' + line
-            newfile += line
-        if data[-1] != '\n' and newfile[-1] == '\n':
-            newfile = newfile[:-1]
+        """ This method receives a YAML file content and loads it, enabling
+            the blocks of comments marked with '# ext:ext_name' (see
+            get_extended_yaml()). Returns whether the file has any of them. """
+
+        newfile, has_extensions = get_extended_yaml(data.split("\n"), ext_name)
         self._config = yaml.safe_load(newfile)
+        self._results = {}
         return has_extensions
 
-    def _load_secrets(self, filename):
+    @staticmethod
+    def get_secrets_file(filename=None) -> Optional[str]:
+        """ Returns the secrets file used with a snapcraft.yaml file: the
+            one in the user configuration folder or, if there isn't one,
+            the one in the folder of the snapcraft.yaml file. Returns None
+            if there is none of them. """
         secrets_file = os.path.expanduser('~/.config/updatesnap/updatesnap.secrets')
         if os.path.exists(secrets_file):
+            return secrets_file
+        if filename is None:
+            return None
+        secrets_file = os.path.join(os.path.split(os.path.abspath(filename))[0],
+                                    "updatesnap.secrets")
+        if os.path.exists(secrets_file):
+            return secrets_file
+        return None
+
+    def _load_secrets(self, filename):
+        secrets_file = self.get_secrets_file(filename)
+        if secrets_file is not None:
             with open(secrets_file, "r", encoding="utf8") as cfg:
                 self._secrets = yaml.safe_load(cfg)
-        else:
-            if filename is not None:
-                secrets_file = os.path.join(os.path.split(os.path.abspath(filename))[0],
-                                            "updatesnap.secrets")
-                if os.path.exists(secrets_file):
-                    with open(secrets_file, "r", encoding="utf8") as cfg:
-                        self._secrets = yaml.safe_load(cfg)
         self._github.set_secrets(self._secrets)
         self._gitlab.set_secrets(self._secrets)
-
-    def _get_tags(self, source, current_tag=None, version_format=None):
-        tags = self._github.get_tags(source, current_tag, version_format)
+        self._git.set_secrets(self._secrets)
+
+    def _get_tags(self, source, current_tag=None):
+        """ Returns the tags of a repository, at least until the current
+            one. They are shared by all the parts with the same source, so
+            each part parses the versions with its own version format (see
+            _get_tag_version()). """
+        tags = self._index.get("tags", source,
+                               lambda: SharedTags(lambda tag: self._fetch_tags(source, tag)))
+        return tags.get(current_tag)
+
+    def _get_last_tags(self, source, version_format=None):
+        return self._index.get("last-tags", source,
+                               lambda: self._fetch_last_tags(source, version_format),
+                               version_format)
+
+    def _get_branches(self, source, current_branch=None):
+        """ Returns the branches of a repository. If the current branch is
+            known, and the backend allows it, only the current branch, the
+            newer ones and the most recent ones are read. """
+        if current_branch is not None:
+            branches = self._index.get("recent-branches", source,
+                                       lambda: self._fetch_recent_branches(source,
+                                                                           current_branch),
+                                       current_branch)
+            if branches is not None:
+                return branches
+        return self._index.get("branches", source, lambda: self._fetch_branches(source))
+
+    def _probe_tags(self, source, previous=None):
+        """ Probes the tags of a repository once per run. The fingerprint
+            is the one of the current tags, whatever the validators used,
+            so the probe is valid for all the parts with the same source. """
+        return self._index.get("probe", source, lambda: self._fetch_probe(source, previous))
+
+    def _fetch_probe(self, source, previous=None):
+        for backend in [self._github, self._gitlab, self._git]:
+            probe = backend.probe_tags(source, previous)
+            if probe is not None:
+                return probe
+        return None
+
+    def _fetch_tags(self, source, current_tag=None):
+        tags = self._github.get_tags(source, current_tag)
+        if tags is not None:
+            return tags
+        tags = self._gitlab.get_tags(source, current_tag)
         if tags is not None:
             return tags
-        tags = self._gitlab.get_tags(source, current_tag, version_format)
+        tags = self._git.get_tags(source, current_tag)
         return tags
 
-    def _get_branches(self, source):
+    def _fetch_last_tags(self, source, version_format=None, count=4):
+        """ Returns the most recent tags. If the backend returns the tags
+            sorted by date, only the first ones are downloaded. """
+        for backend in [self._github, self._gitlab, self._git]:
+            tags = backend.iter_tags(source, None, version_format)
+            if tags is None:
+                continue
+            if backend.tags_sorted_by_date:
+                tags = itertools.islice(tags, count)
+            return heapq.nlargest(count, tags, key=self._date_key)
+        return None
+
+    def _get_last_branches(self, source):
+        return self._index.get("last-branches", source,
+                               lambda: self._fetch_recent_branches(source, None))
+
+    def _fetch_recent_branches(self, source, current_branch):
+        for backend in [self._github, self._gitlab, self._git]:
+            branches = backend.get_recent_branches(source, current_branch)
+            if branches is not None:
+                return branches
+        return None
+
+    def _fetch_branches(self, source):
         branches = self._github.get_branches(source)
         if branches is not None:
             return branches
         branches = self._gitlab.get_branches(source)
+        if branches is not None:
+            return branches
+        branches = self._git.get_branches(source)
         return branches
 
     def process_parts(self) -> tuple[list, bool]:
         """ Processes all the parts of the current YAML file
 
         It goes through each part in the current YAML file and
-        updates the version to the latest one. """
+        updates the version to the latest one. If more than one job
+        is allowed, the parts are processed in parallel, and the messages
+        of each part are printed together when it ends. The results are
+        always in the same order than the parts. """
         if self._config is None:
             return []
         self._tag_error = False
-        parts = []
-        for part in self._config['parts']:
-            parts.append(self.process_part(part))
+        part_names = self.get_part_names()
+        if (self._jobs <= 1) or (len(part_names) <= 1):
+            parts = [self.process_part(part) for part in part_names]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self._jobs, len(part_names))) as executor:
+                parts = list(executor.map(self.process_part_buffered, part_names))
         return parts, self._tag_error
 
+    def get_part_names(self) -> list:
+        """ Returns the names of the parts of the current YAML file """
+        if (self._config is None) or ('parts' not in self._config):
+            return []
+        return list(self._config['parts'])
+
+    def process_part_buffered(self, part: str) -> Optional[dict]:
+        """ Works like process_part(), but keeps the messages and prints
+            them together at the end, to allow to process several parts
+            in parallel without mixing their messages. """
+        return self._call_buffered(self.process_part, part)
+
+    async def process_parts_async(self) -> tuple[list, bool]:
+        """ Asynchronous version of process_parts()
+
+        The parts are processed at the same time, up to the number of
+        jobs allowed, with their messages printed together when each
+        part ends, like in process_parts(). The results are always in
+        the same order than the parts.
+
+        The requests are still blocking: each part is processed in a
+        worker thread, so the event loop isn't blocked, but it doesn't
+        use less threads than process_parts(). """
+        if self._config is None:
+            return []
+        self._tag_error = False
+        part_names = self.get_part_names()
+        if (self._jobs <= 1) or (len(part_names) <= 1):
+            parts = [await self.process_part_async(part) for part in part_names]
+            return parts, self._tag_error
+        semaphore = asyncio.Semaphore(self._jobs)
+
+        async def process(part):
+            async with semaphore:
+                return await asyncio.to_thread(self.process_part_buffered, part)
+
+        parts = await asyncio.gather(*[process(part) for part in part_names])
+        return list(parts), self._tag_error
+
+    async def process_part_async(self, part: str) -> Optional[dict]:
+        """ Asynchronous version of process_part(), done in a worker thread """
+        return await asyncio.to_thread(self.process_part, part)
+
     def process_part(self, part: str) -> Optional[dict]:
-        # pylint: disable=too-many-return-statements,too-many-branches,too-many-statements
         """ Processes an specific part of the current YAML file
 
         It takes the YAML data of the specified part, downloads all
@@ -652,8 +1336,57 @@ class Snapcraft(ProcessVersion):
         with the current version, finds the most recent in the repository,
         and returns the part data modified with the new version.
 
+        If a state is set, and neither the part nor the upstream tags
+        changed since the last run, the result of the last run is returned.
+
         If it returns None, there is no new version for that part
         """
+        start = time.monotonic()
+        result = self._process_part_with_state(part)
+        self._results[part] = result
+        if self._part_listener is not None:
+            snap_name = self._config.get('name') if self._config is not None else None
+            self._part_listener(snap_name, part, result, time.monotonic() - start)
+        return result
+
+    def _process_part_with_state(self, part: str) -> Optional[dict]:
+        """ Returns the result of the last run if the part and its upstream
+            tags didn't change; if not, evaluates the part again """
+        if self._state is None:
+            return self._process_part(part)
+        if (self._config is None) or (part not in self._config['parts']):
+            return self._process_part(part)
+        data = self._config['parts'][part]
+        # only the parts that use a tag can be updated by a change in the tags
+        if (('source' not in data) or ('source-tag' not in data) or
+                ('source-branch' in data)):
+            return self._process_part(part)
+        key = PartState.get_key(self._config.get('name'), part)
+        # a copy, because the version format can be modified while processing the part
+        part_config = json.loads(json.dumps(data, default=str))
+        entry = self._state.get(key)
+        previous = None
+        if (entry is not None) and (entry["part"] == part_config):
+            previous = entry["probe"]
+        try:
+            probe = self._probe_tags(data['source'], previous)
+        except (ValueError, ConnectionError):
+            probe = None
+        if ((probe is not None) and (previous is not None) and
+                (probe["fingerprint"] == previous["fingerprint"])):
+            self._print_message(part, "Upstream tags unchanged since the last run\n",
+                                source=data['source'])
+            result = copy.deepcopy(entry["result"])
+            result["version"] = tuple(result["version"])
+            return result
+        result = self._process_part(part)
+        if (probe is not None) and (result is not None) and (result["version"] is not None):
+            self._state.set(key, {"part": part_config, "probe": probe, "result": result})
+        return result
+
+    def _process_part(self, part: str) -> Optional[dict]:
+        # pylint: disable=too-many-return-statements,too-many-branches,too-many-statements
+        """ Evaluates the tags or branches of an specific part """
 
         part_data = {
             "name": part,
@@ -730,19 +1463,12 @@ class Snapcraft(ProcessVersion):
                               source=source, extra_cr=True)
             return part_data
 
-        if 'savannah' in source:
-            url = urllib.parse.urlparse(source)
-            if 'savannah' in url.netloc:
-                self._print_error(part, self._colors.warning, "Savannah repositories not supported",
-                                  source=source, extra_cr=True)
-                return part_data
-
         self._print_message(part, None, source=source)
 
         if ('source-tag' not in data) and ('source-branch' not in data):
             try:
-                tags = self._get_tags(source, current_tag, version_format)
-                branches = self._get_branches(source)
+                tags = self._get_last_tags(source, version_format)
+                branches = self._get_last_branches(source)
             except (ValueError, ConnectionError) as exception:
                 self._tag_error = True
                 self._print_error(part, self._colors.critical, f"Invalid URI: {exception}",
@@ -758,10 +1484,12 @@ class Snapcraft(ProcessVersion):
                 self._tag_error = True
             if tags is not None:
                 self._print_last_tags(part, tags)
+            if branches is not None:
+                self._print_last_branches(part, branches)
 
         if 'source-tag' in data:
             try:
-                tags = self._get_tags(source, current_tag, version_format)
+                tags = self._get_tags(source, current_tag)
             except (ValueError, ConnectionError) as exception:
                 self._tag_error = True
                 self._print_error(part, self._colors.critical, f"Invalid URI: {exception}",
@@ -782,7 +1510,7 @@ class Snapcraft(ProcessVersion):
             current_version = data['source-branch']
             self._print_message(part, f"Current version: {current_version}\n")
             try:
-                branches = self._get_branches(source)
+                branches = self._get_branches(source, current_version)
             except (ValueError, ConnectionError) as exception:
                 self._tag_error = True
                 self._print_error(part, self._colors.critical, f"Invalid URI: {exception}",
@@ -803,38 +1531,71 @@ class Snapcraft(ProcessVersion):
                 self._print_error(part, self._colors.critical, message, extra_cr=True)
         return part_data
 
+    @staticmethod
+    def _date_key(element):
+        """ Sort key for tags and branches. Some backends can't provide
+            the dates, so the elements without date go at the end. """
+        date = element.get('date')
+        return (date is not None, date if date is not None else 0)
+
     def _print_last_tags(self, part, tags):
-        tags.sort(reverse=True, key=lambda x: x.get('date'))
-        tags = tags[:4]
+        tags = heapq.nlargest(4, tags, key=self._date_key)
         self._print_message(part, "Last tags:\n")
         for tag in tags:
             self._print_message(part, f"  {tag['name']} ({tag['date']})\n")
 
     def _print_last_branches(self, part, branches):
-        branches.sort(reverse=True, key=lambda x: x.get('date'))
-        branches = branches[:4]
+        branches = heapq.nlargest(4, branches, key=self._date_key)
         self._print_message(part, "Last branches:\n")
         for branch in branches:
             self._print_message(part, f"  {branch['name']} ({branch['date']})\n")
 
-    def _sort_tags(self, part, current_tag, tags, part_data):
-        current_date = None
-        found_tag = None
-        for tag in tags:
-            if tag['name'] == current_tag:
-                current_date = tag['date']
-                found_tag = tag
-                break
-
-        if current_date is None:
-            self._print_error(part, self._colors.critical, f"Error:{self._colors.reset} "
-                              "can't find the current tag in the tag list.")
-            return
+    def _get_tag_version(self, part, tag, version_format):
+        """ Returns the version of a tag, parsing it only if the backend
+            didn't do it already """
+        version = tag.get('version')
+        if version is None:
+            version = self._get_version(part, tag['name'], version_format, False)
+        return version
 
-        version_format = part_data["version_format"]
-        self._print_message(part, f"Current tag date: {current_date}\n")
-        part_data['version'] = (found_tag['name'], current_date)
-        current_version = self._get_version(part, current_tag, version_format, True)
+    def _get_newer_tags(self, part, found_tag, tags, version_format) -> list:
+        """ Returns the tags newer than the current one, sorted from the
+            newest to the oldest """
+        newer_tags = self._rank_newer_tags(found_tag, tags, version_format)
+        if newer_tags is not None:
+            return newer_tags
+        return self._filter_newer_tags(part, found_tag, tags, version_format)
+
+    def _rank_newer_tags(self, found_tag, tags, version_format) -> Optional[list]:
+        """ Selects and sorts the newer tags over packed columns (see
+            TagRanking). Returns None if the version format or the tags
+            can't be packed, or if the current tag doesn't follow the
+            format; in that case, the tags must be checked one by one. """
+        ranking = TagRanking(version_format)
+        if not ranking.supported:
+            return None
+        names = [tag['name'] for tag in tags]
+        columns = ranking.pack(names, [tag.get('version') for tag in tags],
+                               [tag.get('date') for tag in tags])
+        if columns is None:
+            return None
+        current = ranking.get_current(columns, names.index(found_tag['name']))
+        if current is None:
+            return None
+        newer = ranking.get_newer(columns, current,
+                                  exclude=bytes(map(found_tag['name'].__eq__, names)),
+                                  same_major=self._checkopt("same-major", version_format),
+                                  same_minor=self._checkopt("same-minor", version_format),
+                                  by_date=found_tag['date'] is not None)
+        return [tags[index] for index in newer]
+
+    def _filter_newer_tags(self, part, found_tag, tags, version_format) -> list:
+        """ Works like _get_newer_tags(), but checking the tags one by one """
+        current_tag = found_tag['name']
+        current_date = found_tag['date']
+        current_version = found_tag.get('version')
+        if current_version is None:
+            current_version = self._get_version(part, current_tag, version_format, True)
 
         newer_tags = []
         for tag in tags:
@@ -842,11 +1603,13 @@ class Snapcraft(ProcessVersion):
                 continue
 
             if current_version is not None:
-                version = self._get_version(part, tag['name'], version_format, False)
+                version = self._get_tag_version(part, tag, version_format)
                 if (version is None) or (version <= current_version):
                     continue
 
-            if (current_version is None) and (tag['date'] < current_date):
+            if (current_version is None) and ((tag['date'] is None) or
+                                              (current_date is None) or
+                                              (tag['date'] < current_date)):
                 continue
 
             if (("same-major" in version_format) and
@@ -861,17 +1624,44 @@ class Snapcraft(ProcessVersion):
 
             newer_tags.append(tag)
 
+        if current_date is None:
+            # without dates, the newest tag is the one with the highest version
+            newer_tags.sort(reverse=True, key=lambda x: self._get_tag_version(
+                part, x, version_format))
+        else:
+            newer_tags.sort(reverse=True, key=self._date_key)
+        return newer_tags
+
+    def _sort_tags(self, part, current_tag, tags, part_data):
+        current_date = None
+        found_tag = None
+        for tag in tags:
+            if tag['name'] == current_tag:
+                current_date = tag['date']
+                found_tag = tag
+                break
+
+        if found_tag is None:
+            self._print_error(part, self._colors.critical, f"Error:{self._colors.reset} "
+                              "can't find the current tag in the tag list.")
+            return
+
+        version_format = part_data["version_format"]
+        self._print_message(part, f"Current tag date: {current_date}\n")
+        part_data['version'] = (found_tag['name'], current_date)
+        newer_tags = self._get_newer_tags(part, found_tag, tags, version_format)
         if len(newer_tags) == 0:
             self._print_message(part, f"{self._colors.all_ok}Tag updated{self._colors.reset}\n")
             return
 
         self._print_message(part, f"{self._colors.warning}Newer tags:{self._colors.reset}\n")
-        newer_tags.sort(reverse=True, key=lambda x: x.get('date'))
         for tag in newer_tags:
             self._print_message(part, f"  {tag['name']} ({tag['date']})\n")
             part_data["updates"].append(tag)
 
-    def _sort_elements(self, part, current_version, elements, text):
+    def _sort_elements(self, part, current_version, elements, text) -> list:
+        """ Prints the elements newer than the current one, and returns
+            them sorted from the newest to the oldest """
         newer_elements = []
         if elements is None:
             elements = []
@@ -881,16 +1671,19 @@ class Snapcraft(ProcessVersion):
                 current_element = element
                 break
         for element in elements:
-            if ('date' in element) and ((current_element is None) or
-                                        (element['date'] > current_element['date'])):
+            if element.get('date') is None:
+                continue
+            if ((current_element is None) or (current_element.get('date') is None) or
+                    (element['date'] > current_element['date'])):
                 newer_elements.append(element)
         if len(newer_elements) == 0:
             self._print_message(part, f"{self._colors.all_ok}Branch updated{self._colors.reset}\n")
         else:
             self._print_message(part, text)
-            newer_elements.sort(reverse=True, key=lambda x: x.get('date'))
+            newer_elements.sort(reverse=True, key=self._date_key)
             for element in newer_elements:
                 self._print_message(part, f"  {element}\n")
+        return newer_elements
 
     def process_metadata(self) -> Optional[dict]:
         """ Returns metadata from Snapcraft.yaml file """
@@ -914,7 +1707,11 @@ class Snapcraft(ProcessVersion):
 
         if 'adopt-info' in data:
             metadata['adopt-info'] = data['adopt-info']
-            upstream_data = self.process_part(data['adopt-info'])
+            # the part was already evaluated if process_parts() was called
+            if data['adopt-info'] in self._results:
+                upstream_data = self._results[data['adopt-info']]
+            else:
+                upstream_data = self.process_part(data['adopt-info'])
             metadata['upstream-url'] = upstream_data['source_url']
             if len(upstream_data['updates']) != 0:
                 metadata['upstream-version'] = upstream_data['updates'][0]['name']
@@ -0,0 +1,53 @@
+""" Compact record for the tags returned by the GIT backends """
+
+import datetime
+from typing import Optional
+
+
+class Tag:
+    """ A tag of a repository, with the SHA and the date of its commit, and
+        its version already parsed with the version format of the part, so
+        it isn't parsed again when the tags are sorted.
+
+    It uses __slots__ to reduce the memory used by repositories with many
+    tags. It also supports the dictionary syntax (tag['name'],
+    tag.get('date')) used before, to keep compatibility with the code
+    that still works with dictionaries. """
+    __slots__ = ('name', 'date', 'sha', 'version')
+
+    def __init__(self, name: str, date: Optional[datetime.datetime] = None,
+                 sha: Optional[str] = None, version=None):
+        self.name = name
+        self.date = date
+        self.sha = sha
+        self.version = version
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return (key in self.__slots__) and (getattr(self, key) is not None)
+
+    def get(self, key: str, default=None):
+        """ Returns an element, or the default value if it isn't defined """
+        if key not in self:
+            return default
+        return getattr(self, key)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Tag):
+            return NotImplemented
+        return ((self.name, self.date, self.sha, self.version) ==
+                (other.name, other.date, other.sha, other.version))
+
+    def __hash__(self) -> int:
+        return hash((self.name, self.sha))
+
+    def __repr__(self) -> str:
+        return f"Tag({self.name!r}, {self.date!r}, {self.sha!r})"
+
+    def to_dict(self) -> dict:
+        """ Returns the name, the date and the SHA as a dictionary """
+        return {"name": self.name, "date": self.date, "sha": self.sha}
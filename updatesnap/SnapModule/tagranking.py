@@ -0,0 +1,244 @@
+""" Batch filtering and ranking of tags. The versions of a list of tags are
+    packed into integer columns, and the rules of the version format are
+    applied as masks over whole columns. Each mask is built with map() over
+    a column and a bound comparison, so the loops run inside the
+    interpreter instead of calling Python code for each tag.
+
+    Only the numeric formats (those without '%V') can be packed; for the
+    other ones, the caller must keep processing the tags one by one. """
+
+import array
+import datetime
+import heapq
+import itertools
+import operator
+from typing import Optional
+
+import packaging.version
+
+from SnapModule.versionformat import get_version_format, parse_version
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# bits used by each number in the packed version
+_BITS = 21
+_LIMIT = 1 << _BITS
+# the tags without date go after all the others
+_NO_DATE = -(1 << 63)
+
+
+def get_release(version) -> Optional[tuple]:
+    """ Returns the (major, minor, revision) tuple that compares like a
+        version, or None if the version has more elements than those """
+    if not isinstance(version, packaging.version.Version):
+        return None
+    if ((version.epoch != 0) or (version.pre is not None) or (version.post is not None) or
+            (version.dev is not None) or (version.local is not None)):
+        return None
+    release = list(version.release)
+    # trailing zeros are ignored when comparing versions
+    while (len(release) > 3) and (release[-1] == 0):
+        release.pop()
+    if len(release) > 3:
+        return None
+    return tuple(release + [0] * (3 - len(release)))
+
+
+def pack_release(release: tuple) -> Optional[int]:
+    """ Packs a (major, minor, revision) tuple in a single integer that
+        keeps their order, or returns None if a number is too big """
+    major, minor, revision = release
+    if (major >= _LIMIT) or (minor >= _LIMIT) or (revision >= _LIMIT):
+        return None
+    return (((major << _BITS) | minor) << _BITS) | revision
+
+
+def get_epoch(date: datetime.datetime) -> int:
+    """ Returns a date as microseconds since the epoch. Dates without a
+        timezone are taken as UTC, to keep their order. """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return (date - _EPOCH) // _MICROSECOND
+
+
+def _and(*masks) -> bytes:
+    """ Returns the logical AND of several masks of zeros and ones """
+    result = masks[0]
+    for mask in masks[1:]:
+        result = bytes(map(operator.and_, result, mask))
+    return result
+
+
+def _or(first, second) -> bytes:
+    return bytes(map(operator.or_, first, second))
+
+
+def _not(mask) -> bytes:
+    return bytes(map(operator.xor, mask, itertools.repeat(1)))
+
+
+class TagColumns:
+    # pylint: disable=too-few-public-methods
+    """ The versions and dates of a list of tags, packed in columns """
+    def __init__(self):
+        # the version, with the major, minor and revision packed together
+        self.version = array.array('q')
+        self.minor = array.array('q')
+        self.revision = array.array('q')
+        # microseconds since the epoch, or _NO_DATE
+        self.date = array.array('q')
+        # whether the tag follows the version format
+        self.valid = bytearray()
+        # whether the version was already parsed and filtered by the backend
+        self.known = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def get_major(self) -> array.array:
+        """ Returns the column with the major numbers """
+        return array.array('q', map(operator.rshift, self.version,
+                                    itertools.repeat(2 * _BITS)))
+
+
+class TagRanking:
+    """ Filters and ranks tags with the rules of a version-format entry.
+        If the entry can't be expressed with integer columns, 'supported'
+        is False, and the tags must be checked one by one. """
+    def __init__(self, entry_format):
+        self.supported = False
+        self._format = None
+        self._lower_than = None
+        self._ignore = set()
+        self._odd_minor = False
+        self._no_9x_revisions = False
+        self._no_9x_minors = False
+        if (not isinstance(entry_format, dict)) or ("format" not in entry_format):
+            return
+        self._format = get_version_format(entry_format["format"])
+        if self._format.variation:
+            return
+        self._odd_minor = bool(entry_format.get("ignore-odd-minor"))
+        self._no_9x_revisions = bool(entry_format.get("no-9x-revisions"))
+        self._no_9x_minors = bool(entry_format.get("no-9x-minors"))
+        to_ignore = entry_format.get("ignore-version", [])
+        if isinstance(to_ignore, str):
+            to_ignore = [to_ignore]
+        # wrong entries are reported by the tag-by-tag code
+        if (not isinstance(to_ignore, list)) or any(not isinstance(element, str)
+                                                    for element in to_ignore):
+            return
+        try:
+            for element in to_ignore:
+                release = get_release(parse_version(element))
+                # a version with more elements never matches one of the tags
+                if (release is not None) and (pack_release(release) is not None):
+                    self._ignore.add(pack_release(release))
+            if "lower-than" in entry_format:
+                release = get_release(parse_version(str(entry_format["lower-than"])))
+                if (release is None) or (pack_release(release) is None):
+                    return
+                self._lower_than = pack_release(release)
+        except packaging.version.InvalidVersion:
+            return
+        self.supported = True
+
+    def pack(self, names: list, versions: Optional[list] = None,
+             dates: Optional[list] = None) -> Optional[TagColumns]:
+        """ Packs the versions and dates of a list of tags. If the version
+            of a tag is already known, it is used instead of parsing its
+            name. Returns None if a known version isn't a plain release,
+            or if a number doesn't fit in the columns. """
+        if versions is None:
+            versions = [None] * len(names)
+        if dates is None:
+            dates = [None] * len(names)
+        match = self._format.match
+        releases = [match(name) if version is None else get_release(version)
+                    for name, version in zip(names, versions)]
+        columns = TagColumns()
+        columns.valid = bytearray(map(operator.is_not, releases, itertools.repeat(None)))
+        columns.known = bytearray(map(operator.is_not, versions, itertools.repeat(None)))
+        if any(map(operator.gt, columns.known, columns.valid)):
+            return None
+        if any((date is not None) and (not isinstance(date, datetime.datetime))
+               for date in dates):
+            return None
+        majors, minors, revisions = zip(*[release or (0, 0, 0) for release in releases]) \
+            if releases else ((), (), ())
+        if max(itertools.chain(majors, minors, revisions), default=0) >= _LIMIT:
+            return None
+        columns.minor = array.array('q', minors)
+        columns.revision = array.array('q', revisions)
+        columns.version = array.array('q', map(
+            operator.or_,
+            map(operator.lshift, majors, itertools.repeat(2 * _BITS)),
+            map(operator.or_, map(operator.lshift, minors, itertools.repeat(_BITS)), revisions)))
+        columns.date = array.array('q', [_NO_DATE if date is None else get_epoch(date)
+                                         for date in dates])
+        return columns
+
+    def get_mask(self, columns: TagColumns) -> bytes:
+        """ Returns the mask of the tags that pass all the filters. The
+            versions already known are taken as filtered. """
+        masks = [b'\x01' * len(columns)]
+        if self._ignore:
+            masks.append(_not(bytes(map(self._ignore.__contains__, columns.version))))
+        if self._lower_than is not None:
+            masks.append(bytes(map(self._lower_than.__gt__, columns.version)))
+        if self._odd_minor:
+            masks.append(_not(bytes(map(operator.and_, columns.minor, itertools.repeat(1)))))
+        if self._no_9x_revisions:
+            masks.append(bytes(map((90).__gt__, columns.revision)))
+        if self._no_9x_minors:
+            masks.append(bytes(map((90).__gt__, columns.minor)))
+        return _and(columns.valid, _or(_and(*masks), columns.known))
+
+    def get_versions(self, names: list) -> Optional[list]:
+        """ Returns the version of each tag, or None for the tags that don't
+            follow the format or are filtered out. Returns None if the tags
+            can't be packed. """
+        if not self.supported:
+            return None
+        columns = self.pack(names)
+        if columns is None:
+            return None
+        return [parse_version(self._unpack(version)) if valid else None
+                for valid, version in zip(self.get_mask(columns), columns.version)]
+
+    @staticmethod
+    def _unpack(version: int) -> str:
+        mask = _LIMIT - 1
+        return f"{version >> (2 * _BITS)}.{(version >> _BITS) & mask}.{version & mask}"
+
+    def get_current(self, columns: TagColumns, index: int) -> Optional[int]:
+        """ Returns the packed version of a tag, or None if it doesn't
+            follow the format or is filtered out """
+        if not self.get_mask(columns)[index]:
+            return None
+        return columns.version[index]
+
+    def get_newer(self, columns: TagColumns, current: int, *, exclude: Optional[bytes] = None,
+                  same_major=False, same_minor=False, by_date=True,
+                  count: Optional[int] = None) -> list:
+        """ Returns the indexes of the tags newer than the current version
+            that pass all the filters, from the newest to the oldest (by
+            date, or by version if by_date is False). The tags without date
+            go at the end. The tags marked in 'exclude' are skipped. If
+            count is set, only the first ones are selected, without sorting
+            the candidates. """
+        # pylint: disable=too-many-arguments
+        masks = [self.get_mask(columns), bytes(map(current.__lt__, columns.version))]
+        if exclude is not None:
+            masks.append(_not(exclude))
+        if same_major:
+            masks.append(bytes(map((current >> (2 * _BITS)).__eq__, columns.get_major())))
+        if same_minor:
+            minor = (current >> _BITS) & (_LIMIT - 1)
+            masks.append(bytes(map(minor.__eq__, columns.minor)))
+        candidates = list(itertools.compress(range(len(columns)), _and(*masks)))
+        keys = columns.date if by_date else columns.version
+        if count is not None:
+            return heapq.nlargest(count, candidates, key=keys.__getitem__)
+        return sorted(candidates, key=keys.__getitem__, reverse=True)
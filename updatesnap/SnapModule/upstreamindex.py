@@ -0,0 +1,115 @@
+""" In-run index of the data obtained from each upstream repository. Many
+    snaps bundle the same sources (glib, gtk, libadwaita...), so the tags
+    and branches of each one are asked only once, however many parts or
+    snaps use it. If several threads ask for the same data at the same
+    time, only the first one does the request, and the others wait for
+    its result. """
+
+import json
+import threading
+import urllib.parse
+from concurrent.futures import Future
+from typing import Optional
+
+
+class UpstreamIndex:
+    """ Stores the result of each lookup, keyed by the kind of data, the
+        normalized URI of the repository and the rest of parameters """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def normalize_uri(uri: str) -> str:
+        """ Returns a canonical form of a repository URI, so the different
+            ways of writing the same repository share the same entry """
+        uri = uri.strip()
+        if uri.endswith('/'):
+            uri = uri.rstrip('/')
+        if uri.endswith('.git'):
+            uri = uri[:-4]
+        parsed = urllib.parse.urlparse(uri)
+        scheme = parsed.scheme.lower()
+        if scheme in ['http', 'git']:
+            scheme = 'https'
+        netloc = parsed.netloc.lower()
+        if netloc.startswith('www.'):
+            netloc = netloc[4:]
+        return parsed._replace(scheme=scheme, netloc=netloc).geturl()
+
+    @staticmethod
+    def _get_key(kind: str, uri: str, parameters: tuple) -> tuple:
+        # the version format is a dictionary, so it is converted to a string
+        return (kind, UpstreamIndex.normalize_uri(uri),
+                json.dumps(parameters, sort_keys=True, default=str))
+
+    def get(self, kind: str, uri: str, loader, *parameters):
+        """ Returns the data of a kind for a repository. If it isn't in the
+            index, it calls the loader to get it. Errors are stored too, so
+            a failing repository isn't asked again in the same run. """
+        key = self._get_key(kind, uri, parameters)
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._entries[key] = future
+                self._misses += 1
+            else:
+                self._hits += 1
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as exception:  # pylint: disable=broad-exception-caught
+                future.set_exception(exception)
+        result = future.result()
+        if isinstance(result, list):
+            # each caller gets its own list, because they are sorted in place
+            return list(result)
+        return result
+
+    def get_stats(self) -> dict:
+        """ Returns the number of lookups answered from the index (hits)
+            and the number of them that required to ask the upstream
+            repository (misses) """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses}
+
+
+class SharedTags:
+    # pylint: disable=too-few-public-methods
+    """ The tags of a repository, shared by all the parts that use it,
+        whatever their current tag and version format. The backends can
+        stop reading the tags at the current one, so they are read again
+        only if a part needs a tag older than the ones already read. """
+    def __init__(self, loader):
+        self._lock = threading.Lock()
+        self._loader = loader
+        self._tags = None
+        self._names = set()
+        self._complete = False
+        self._error = None
+
+    def get(self, current_tag: Optional[str] = None) -> Optional[list]:
+        """ Returns the tags, at least until the current one. The version
+            isn't parsed, because it depends on the version format of the
+            part. """
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if (not self._complete) and ((self._tags is None) or
+                                         (current_tag not in self._names)):
+                try:
+                    self._tags = self._loader(current_tag)
+                except Exception as exception:  # pylint: disable=broad-exception-caught
+                    self._error = exception
+                    raise
+                self._names = {tag['name'] for tag in self._tags or []}
+                # without a current tag, or if it wasn't found, all the tags were read
+                self._complete = ((self._tags is None) or (current_tag is None) or
+                                  (current_tag not in self._names))
+            if self._tags is None:
+                return None
+            return list(self._tags)
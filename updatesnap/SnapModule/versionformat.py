@@ -0,0 +1,71 @@
+""" Compiled version-format strings. Each format is translated once into a
+    regular expression, and the compiled format is reused for every tag,
+    instead of interpreting the format string again for each one. """
+
+import functools
+import re
+from typing import Optional
+
+import packaging.version
+
+
+class VersionFormat:
+    """ A version-format string, like 'v%M.%m.%R', compiled into a regular
+        expression that extracts the major, minor and revision numbers.
+
+    The numbers are read greedily and without backtracking, like the
+    original parser did, so '%M%m' never splits a number in two, and the
+    text after the last element is ignored. A format with '%V' takes
+    everything after the prefix as the version. """
+    def __init__(self, version_format: str):
+        self.format = version_format
+        self.prefix = version_format.split('%')[0]
+        self.variation = '%V' in version_format
+        self._fields = []
+        self._regex = None
+        self._groups = (None, None, None)
+        if self.variation:
+            return
+        expression = ""
+        # space is "no element". Adding it in front of the first block simplifies the code
+        for index, block in enumerate((" " + version_format).split("%")):
+            if block[0] != ' ':
+                # emulates an atomic group, which isn't available in Python 3.10
+                name = f"n{index}"
+                expression += f"(?=(?P<{name}>[0-9]+))(?P={name})"
+                self._fields.append((name, block[0]))
+            expression += re.escape(block[1:])
+        self._regex = re.compile(expression)
+        # the group that holds each number; when an element appears twice, the last one wins
+        groups = {field: name for name, field in self._fields}
+        self._groups = tuple(groups.get(field) for field in "MmR")
+
+    def match(self, entry: str) -> Optional[tuple]:
+        """ Returns a tuple with the major, minor and revision numbers of
+            a tag, or None if the tag doesn't follow the format """
+        result = self._regex.match(entry)
+        if result is None:
+            return None
+        major, minor, revision = self._groups
+        return (int(result[major]) if major else 0,
+                int(result[minor]) if minor else 0,
+                int(result[revision]) if revision else 0)
+
+    def get_variation(self, entry: str) -> Optional[str]:
+        """ Returns the version part of a tag for a format with '%V', or
+            None if the tag doesn't start with the prefix of the format """
+        if not entry.startswith(self.prefix):
+            return None
+        return entry[len(self.prefix):]
+
+
+@functools.lru_cache(maxsize=256)
+def get_version_format(version_format: str) -> VersionFormat:
+    """ Returns the compiled version of a version-format string """
+    return VersionFormat(version_format)
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_version(version: str) -> packaging.version.Version:
+    """ Cached version of packaging.version.parse() """
+    return packaging.version.parse(version)
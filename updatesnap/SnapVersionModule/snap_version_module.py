@@ -7,15 +7,15 @@ import subprocess
 import re
 from datetime import datetime
 import logging
-import requests
+from SnapModule.httpsession import get_client
 
 
 def process_snap_version_data(upstreamversion, snap_name, version_schema, has_update):
     """ Returns processed snap version and grade """
 
     # Time stamp of Snap build in Snap Store
-    response = requests.get(f"https://api.snapcraft.io/v2/snaps/info/{snap_name}",
-                            headers={"Snap-Device-Series": "16", }, timeout=20)
+    response = get_client().get(f"https://api.snapcraft.io/v2/snaps/info/{snap_name}",
+                                headers={"Snap-Device-Series": "16", }, timeout=20)
     snap_info = response.json()
 
     edge_channel_info = next((channel for channel in snap_info["channel-map"]
@@ -73,11 +73,10 @@ def is_version_update(snap, manager_yaml, arguments, has_update):
         snap_version = process_snap_version_data(
             metadata['upstream-version'], metadata['name'], arguments.version_schema, has_update)
         if metadata['version'] != snap_version:
-            snap_version_data = manager_yaml.get_part_metadata('version')
-            if snap_version_data is not None:
+            if manager_yaml.get_entry(('version',)) is not None:
                 logging.info("Updating snap version from %s to %s",
                              metadata['version'], snap_version)
-                snap_version_data['data'] = f"version: '{snap_version}'"
+                manager_yaml.apply_updates({('version',): f"'{snap_version}'"})
                 has_version_update = True
             else:
                 logging.warning("Version is not defined in metadata")
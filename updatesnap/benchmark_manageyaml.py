@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+""" Measures the time that ManageYAML needs to parse and write again
+    snapcraft.yaml files of different sizes, to check that it grows linearly
+    with the number of lines. The files are generated, with parts like the
+    ones of the big SDK manifests: comments, blank lines, lists and nested
+    blocks. """
+
+import argparse
+import os
+import sys
+import time
+
+from SnapModule.manageYAML import ManageYAML
+
+
+def generate_snapcraft(lines: int) -> str:
+    """ Returns the contents of a snapcraft.yaml file with, at least, the
+        specified number of lines """
+    contents = ["name: benchmark", "base: core22", "adopt-info: benchmark", "",
+                "# all the parts are generated", "parts:"]
+    index = 0
+    while len(contents) < lines:
+        contents += [f"  part{index}:",
+                     f"    # part number {index}",
+                     f"    source: https://gitlab.gnome.org/GNOME/part{index}.git",
+                     f"    source-tag: '{index % 50}.{index % 7}'",
+                     "    source-depth: 1",
+                     "    plugin: meson",
+                     "    meson-parameters:",
+                     "      - --prefix=/usr",
+                     "      - -Dintrospection=enabled",
+                     "    build-environment:",
+                     "      - PKG_CONFIG_PATH: /usr/lib/pkgconfig",
+                     "    override-build: |",
+                     "      craftctl default",
+                     "      rm -rf $CRAFT_PART_INSTALL/usr/share/doc",
+                     "    update-context:",
+                     "      version-format:",
+                     "        format: '%M.%m'",
+                     ""]
+        index += 1
+    return "\n".join(contents) + "\n"
+
+
+def measure(repeat: int, function, *args) -> float:
+    """ Returns the best time, in seconds, needed to run a function """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        if (best is None) or (elapsed < best):
+            best = elapsed
+    return best
+
+
+def write_yaml(manager_yaml: ManageYAML):
+    """ Writes the YAML file, discarding it, to measure only the time
+        needed to build it """
+    with open(os.devnull, "w", encoding="utf8") as output_file:
+        manager_yaml.write_yaml(output_file)
+
+
+def main():
+    """ Main function """
+    parser = argparse.ArgumentParser(prog="Benchmark ManageYAML",
+                                     description="Measures the time needed to parse "
+                                     "snapcraft.yaml files of several sizes.")
+    parser.add_argument('--repeat', action='store', type=int, default=3,
+                        help='Number of times that each file is parsed; the best '
+                        'time is shown.')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[10000, 20000, 50000, 100000],
+                        help='Number of lines of each generated file.')
+    arguments = parser.parse_args(sys.argv[1:])
+    costs = []
+    print(f"{'lines':>10} {'parse (s)':>10} {'us/line':>10} {'write (s)':>10} {'us/line':>10}")
+    for size in arguments.sizes:
+        contents = generate_snapcraft(size)
+        lines = contents.count("\n")
+        parse = measure(arguments.repeat, ManageYAML, contents)
+        manager_yaml = ManageYAML(contents)
+        write = measure(arguments.repeat, write_yaml, manager_yaml)
+        costs.append((parse / lines, write / lines))
+        print(f"{lines:>10} {parse:>10.4f} {1000000 * parse / lines:>10.3f}"
+              f" {write:>10.4f} {1000000 * write / lines:>10.3f}")
+    # with a linear algorithm, the cost of each line doesn't depend on the size
+    print("Cost per line of the biggest file vs. the smallest: "
+          f"{costs[-1][0] / costs[0][0]:.2f}x (parse), {costs[-1][1] / costs[0][1]:.2f}x (write)")
+
+
+if __name__ == "__main__":
+    main()
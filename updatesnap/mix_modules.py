@@ -6,6 +6,18 @@ import os
 base_file = sys.argv[1]
 destination = os.path.join(sys.argv[2], base_file)
 
+def get_local_module(line):
+    """ Returns the name and path of a SnapModule module imported in a line
+        like 'from SnapModule.snapmodule import ...', or None if the
+        line doesn't import a SnapModule module """
+    if not line.startswith("from SnapModule."):
+        return None
+    name = line.split()[1]
+    path = name.replace(".", "/") + ".py"
+    if not os.path.exists(path):
+        return None
+    return name, path
+
 def load_module(name, path):
     global modules
 
@@ -26,22 +38,35 @@ def add_import(ip):
         return
     imports.append(ip)
 
+def add_module(name, path):
+    """ Adds the contents of a local module, after the contents of the
+        local modules that it imports """
+    global contents
+
+    if name in imported:
+        return
+    imported.append(name)
+    load_module(name, path)
+    for ip in modules[name]["imports"]:
+        local_module = get_local_module(ip)
+        if local_module is not None:
+            add_module(*local_module)
+            continue
+        add_import(ip)
+    contents += modules[name]["content"]
+
 modules = {}
-load_module("SnapModule.snapmodule", "SnapModule/snapmodule.py")
+imported = []
 
 imports = []
 
 contents = ""
 
 with open(base_file, "r") as ifile:
-    imported = []
     for line in ifile:
-        if (line.strip().startswith("from SnapModule.snapmodule import ")):
-            if ("SnapModule.snapmodule" not in imported):
-                imported.append("SnapModule.snapmodule")
-                for ip in modules["SnapModule.snapmodule"]["imports"]:
-                    add_import(ip)
-                contents += modules["SnapModule.snapmodule"]["content"]
+        local_module = get_local_module(line.strip())
+        if local_module is not None:
+            add_module(*local_module)
             continue
         if line.startswith("import ") or (line.startswith("from ")):
             add_import(line.strip())
@@ -13,5 +13,15 @@ test_style () {
 test_style updatesnap.py
 test_style updatesnapyaml.py
 test_style SnapModule/snapmodule.py
+test_style SnapModule/httpcache.py
+test_style SnapModule/commitstore.py
+test_style SnapModule/httpsession.py
+test_style SnapModule/ratelimit.py
+test_style SnapModule/upstreamindex.py
+test_style SnapModule/partstate.py
+test_style SnapModule/versionformat.py
+test_style SnapModule/tag.py
+test_style SnapModule/tagranking.py
+test_style benchmark_manageyaml.py
 test_style unittests.py
 test_style SnapVersionModule/snap_version_module.py
@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
 
 """ Unitary tests for snapmodule """
+# pylint: disable=too-many-lines
 
 import unittest
+import asyncio
 import os
 import datetime
 import sys
 import logging
+import json
+import threading
+import time
+import tempfile
+import http.server
+import subprocess
+import urllib.parse
+import io
+import contextlib
+import re
+import random
 from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
 import yaml
+import requests
 from SnapModule.snapmodule import Snapcraft
 from SnapModule.manageYAML import ManageYAML
+from SnapModule.httpcache import HTTPCache
+from SnapModule.commitstore import CommitStore
+from SnapModule.httpsession import HTTPClient
+from SnapModule.ratelimit import RateLimitScheduler
+from SnapModule.upstreamindex import UpstreamIndex
+from SnapModule.partstate import PartState
+from SnapModule.versionformat import VersionFormat, get_version_format, parse_version
+from SnapModule.tag import Tag
+from SnapModule.tagranking import TagRanking
 from SnapModule.snapmodule import ProcessVersion
 from SnapModule.snapmodule import Github
+from SnapModule.snapmodule import GithubGraphQL
 from SnapModule.snapmodule import Gitlab
+from SnapModule.snapmodule import GitSmartHTTP
 from SnapVersionModule import snap_version_module
 from SnapVersionModule.snap_version_module import is_version_update
+from benchmark_manageyaml import generate_snapcraft
 
 
 class TestYAMLfiles(unittest.TestCase):
@@ -54,7 +81,8 @@ class TestYAMLfiles(unittest.TestCase):
         gitlab_pose = GitPose()
         gitlab_pose.set_tags(tags)
         gitlab_pose.set_branches(branches)
-        snap = Snapcraft(True, github_pose, gitlab_pose)
+        git_pose = GitPose()
+        snap = Snapcraft(True, github_pose, gitlab_pose, git_pose)
         snap.set_full_silent()
         snap.load_external_data(data)
         return snap, data, github_pose, gitlab_pose
@@ -188,6 +216,618 @@ class TestYAMLfiles(unittest.TestCase):
                     break
             assert found
 
+    def test_github_tags_concurrent_dates(self):
+        """ Checks that the commit dates of the tags are resolved in parallel
+            keeping the order of the tags, and only until the current tag """
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        gitobj.set_full_silent()
+        gitobj.set_max_workers(4)
+        data = gitobj.get_tags("https://github.com/GNOME/gnome-calculator.git",
+                               "43.0", {"format": "%M.%m"})
+        assert [tag["name"] for tag in data] == ["44.0", "43.0.1", "43.0"]
+        assert data[0]["date"] == datetime.datetime(2023, 3, 17, 22, 17, 18)
+        assert sorted(gitobj.requested_commits) == ["43.0", "43.0.1", "44.0"]
+
+    def test_tags_without_valid_version(self):
+        """ Checks that a repository whose tags don't follow the version
+            format returns an empty list, instead of being taken as a
+            repository of other type """
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        gitobj.set_full_silent()
+        assert gitobj.get_tags("https://github.com/GNOME/gnome-calculator.git",
+                               None, {"format": "foo-%M.%m"}) == []
+        assert gitobj.get_tags("https://gitlab.gnome.org/GNOME/gnome-calculator.git",
+                               None, {"format": "foo-%M.%m"}) is None
+
+    def test_gitlab_tags_page(self):
+        """ Checks that the Gitlab tags are read until the end of the page
+            that contains the current tag """
+        # pylint: disable=protected-access
+        pages = [[{"name": name, "commit": {"committed_date": "2023-03-17T22:17:18+02:00",
+                                            "id": name}}
+                  for name in page]
+                 for page in [["44.0", "43.2"], ["43.1", "44.beta"], ["43.0", "42.0"]]]
+        gitobj = Gitlab(silent=True)
+        gitobj.set_full_silent()
+        gitobj._iter_pages = lambda uri: iter(pages)
+        data = gitobj.get_tags("https://gitlab.gnome.org/GNOME/gnome-calculator.git",
+                               "43.1", {"format": "%M.%m"})
+        assert [tag["name"] for tag in data] == ["44.0", "43.2", "43.1", "44.beta"]
+
+    def test_github_tags_iterator(self):
+        """ Checks that the tags are downloaded only when they are reached,
+            so stopping the iteration avoids asking for the older ones """
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        gitobj.set_full_silent()
+        gitobj.set_max_workers(2)
+        tags = gitobj.iter_tags("https://github.com/GNOME/gnome-calculator.git",
+                                None, {"format": "%M.%m"})
+        assert next(tags)["name"] == "44.0"
+        assert next(tags)["name"] == "43.0.1"
+        assert sorted(gitobj.requested_commits) == ["43.0.1", "44.0"]
+        assert next(tags)["name"] == "43.0"
+        assert len(gitobj.requested_commits) == 4
+        assert gitobj.iter_tags("https://gitlab.gnome.org/GNOME/gnome-calculator.git") is None
+
+        sorted_pose = GitPose()
+        sorted_pose.tags_sorted_by_date = True
+        sorted_pose.set_tags(get_gnome_calculator_tags())
+        snap = Snapcraft(True, sorted_pose, GitPose(), GitPose())
+        snap.set_full_silent()
+        source = "https://gitlab.gnome.org/GNOME/gnome-calculator.git"
+        # pylint: disable=protected-access
+        tags = snap._fetch_last_tags(source, {}, count=2)
+        # only the first tags are taken if the backend sorts them by date
+        first_tags = get_gnome_calculator_tags()[source][:2]
+        assert tags == sorted(first_tags, reverse=True, key=lambda tag: tag["date"])
+
+    def test_github_graphql_tags(self):
+        """ Checks that the GraphQL backend returns the tags with their dates,
+            paginating until the current tag """
+        GraphQLStandIn.queries = 0
+        with run_stand_in(GraphQLStandIn) as server_uri:
+            gitobj = GithubGraphQL(silent=True, graphql_url=f"{server_uri}/graphql")
+            gitobj.set_full_silent()
+            gitobj.set_secret("user", "user")
+            gitobj.set_secret("token", "token")
+            data = gitobj.get_tags("https://github.com/GNOME/gnome-calculator",
+                                   "42.2", {"format": "%M.%m"})
+            with self.assertRaises(ConnectionError):
+                gitobj.get_tags("https://github.com/GNOME/missing-project",
+                                None, {"format": "%M.%m"})
+        assert [tag["name"] for tag in data] == ["44.0", "43.0.1", "43.0", "42.2"]
+        assert data[0]["date"] == datetime.datetime(2023, 3, 17, 20, 17, 18)
+        assert data[1]["sha"] == "commit-43.0.1"
+        # two pages for the tags, and one for the missing project
+        assert GraphQLStandIn.queries == 3
+
+    def test_http_cache(self):
+        """ Checks that the cached responses are revalidated with conditional
+            requests, and that the least recently used ones are evicted """
+        # pylint: disable=protected-access
+        with tempfile.TemporaryDirectory() as cache_folder:
+            with run_stand_in(ETagStandIn) as server_uri:
+                gitobj = Gitlab(silent=True)
+                gitobj.set_full_silent()
+                gitobj.set_cache(HTTPCache(cache_folder))
+                uri = f"{server_uri}/tags"
+                first = gitobj._read_pages(uri)
+                second = gitobj._read_pages(uri)
+                stats = gitobj._cache.get_stats()
+                cache = HTTPCache(cache_folder, stats["size"] + 10)
+                gitobj.set_cache(cache)
+                gitobj._read_page(uri + "/other?page=2")
+            assert first == second
+            assert [tag["name"] for tag in first] == ["1.2", "1.1", "1.0"]
+            assert stats["hits"] == 2
+            assert stats["misses"] == 2
+            assert cache.get_stats()["evictions"] == 1
+            assert len(os.listdir(cache_folder)) == 2
+
+    def test_commit_store(self):
+        """ Checks that the dates of the commits already known are taken
+            from the commit store instead of being downloaded again """
+        with tempfile.TemporaryDirectory() as store_folder:
+            store = CommitStore(os.path.join(store_folder, "commits.sqlite"))
+            gitobj = GithubPose(get_gnome_calculator_tags())
+            gitobj.set_full_silent()
+            gitobj.set_commit_store(store)
+            first = gitobj.get_tags("https://github.com/GNOME/gnome-calculator.git",
+                                    "43.0", {"format": "%M.%m"})
+            assert len(gitobj.requested_commits) == 3
+            gitobj.requested_commits = []
+            second = gitobj.get_tags("https://github.com/GNOME/gnome-calculator.git",
+                                     "42.2", {"format": "%M.%m"})
+            assert gitobj.requested_commits == ["42.2"]
+            assert second[:3] == first
+            assert store.get_date("github.com/gnome/gnome-calculator",
+                                  "sha-42.2") == second[3]["date"]
+            store.close()
+
+    def test_http_client_keeps_connections(self):
+        """ Checks that the shared HTTP client reuses the same connection
+            for several requests to the same host """
+        KeepAliveStandIn.client_ports = set()
+        with run_stand_in(KeepAliveStandIn) as server_uri:
+            client = HTTPClient(pool_maxsize=2)
+            for _ in range(5):
+                response = client.get(f"{server_uri}/tags")
+                assert response.json() == [{"name": "1.2"}, {"name": "1.1"}]
+        assert len(KeepAliveStandIn.client_ports) == 1
+
+    def test_rate_limit_retries(self):
+        """ Checks that the requests rejected by the rate limit are retried
+            after the time specified by the server, and that the retries
+            are bounded in time """
+        # pylint: disable=protected-access
+        RateLimitStandIn.rejections = 2
+        with run_stand_in(RateLimitStandIn) as server_uri:
+            try:
+                gitobj = Gitlab(silent=True)
+                gitobj.set_full_silent()
+                gitobj.set_scheduler(RateLimitScheduler(max_retry_time=3))
+                data = gitobj._read_page(f"{server_uri}/tags")
+                RateLimitStandIn.rejections = 100
+                with self.assertRaises(ConnectionError):
+                    gitobj._read_page(f"{server_uri}/tags")
+                # the server errors are retried only by the scheduler, so a
+                # retry that doesn't fit in the time limit isn't done
+                RateLimitStandIn.status = 503
+                RateLimitStandIn.rejections = 100
+                gitobj.set_scheduler(RateLimitScheduler(max_retry_time=1))
+                with self.assertRaises(ConnectionError):
+                    gitobj._read_page(f"{server_uri}/tags")
+                # only the first request was done
+                assert RateLimitStandIn.rejections == 99
+            finally:
+                RateLimitStandIn.status = 429
+        assert data == [{"name": "1.2"}, {"name": "1.1"}]
+
+    def test_rate_limit_budget(self):
+        """ Checks that the scheduler waits until the reset time when the
+            budget is exhausted, but only if it isn't too far """
+        scheduler = RateLimitScheduler(max_retry_time=60)
+        exhausted = Namespace(status_code=403, headers={
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(int(datetime.datetime.now().timestamp()) + 3600)})
+        assert scheduler.get_retry_delay(exhausted) > 3500
+        assert scheduler.get_retry_delay(Namespace(status_code=403, headers={})) is None
+        assert scheduler.get_retry_delay(Namespace(status_code=429,
+                                                   headers={"Retry-After": "7"})) == 7
+        scheduler.update(("api.github.com", None), exhausted)
+        with self.assertRaises(ConnectionError):
+            scheduler.wait(("api.github.com", None))
+        scheduler.wait(("gitlab.gnome.org", None))
+        assert 0.5 <= scheduler.get_backoff(0) <= 1
+
+    def test_parallel_pages(self):
+        """ Checks that, when the last page is known, the pages are read in
+            parallel, keeping their order and stopping at the current tag """
+        # pylint: disable=protected-access
+        with run_stand_in(PagesStandIn) as server_uri:
+            gitobj = Gitlab(silent=True)
+            gitobj.set_full_silent()
+            gitobj.set_max_workers(2)
+            uri = f"{server_uri}/tags?sort=desc"
+            PagesStandIn.requested_pages = []
+            data = gitobj._read_pages(uri)
+            all_pages = sorted(PagesStandIn.requested_pages)
+            PagesStandIn.requested_pages = []
+            partial_data = []
+            for page in gitobj._iter_pages(uri):
+                partial_data += page
+                if "4.0" in [tag["name"] for tag in page]:
+                    break
+        names = [f"{major}.{minor}" for major in range(5, 0, -1) for minor in [1, 0]]
+        assert [tag["name"] for tag in data] == names
+        assert all_pages == [1, 2, 3, 4, 5]
+        assert partial_data == data[:4]
+        # the first page, and a group of two pages that contains the current tag
+        assert sorted(PagesStandIn.requested_pages) == [1, 2, 3]
+
+    def test_sliding_pages(self):
+        """ Checks that a slow page doesn't delay the request of the next
+            ones, and that all the pages use the same pool of workers """
+        # pylint: disable=protected-access
+        with run_stand_in(SlowPagesStandIn) as server_uri:
+            gitobj = Gitlab(silent=True)
+            gitobj.set_full_silent()
+            gitobj.set_max_workers(2)
+            SlowPagesStandIn.events = []
+            data = gitobj._read_pages(f"{server_uri}/tags?sort=desc")
+            executor = gitobj._executor
+            gitobj._read_pages(f"{server_uri}/tags?sort=desc")
+            assert gitobj._executor is executor
+        assert len(data) == 10
+        # page 4 is requested as soon as page 2 is taken, without waiting for page 3
+        assert SlowPagesStandIn.events.index(("start", 4)) < \
+            SlowPagesStandIn.events.index(("end", 3))
+
+    def test_async_api(self):
+        """ Checks that several snaps and repositories can be processed
+            at the same time from a single event loop """
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        gitobj.set_full_silent()
+        snap1, _, _, _ = self._load_test_file("gnome-calculator-test1.yaml",
+                                              get_gnome_calculator_tags())
+        snap2, _, _, _ = self._load_test_file("gnome-calculator-test1.yaml",
+                                              get_gnome_calculator_tags())
+
+        async def process_all():
+            return await asyncio.gather(
+                snap1.process_parts_async(),
+                snap2.process_parts_async(),
+                gitobj.get_tags_async("https://github.com/GNOME/gnome-calculator.git",
+                                      "43.0", {"format": "%M.%m"}),
+                gitobj.get_branches_async("https://gitlab.gnome.org/GNOME/gnome-calculator"))
+
+        result1, result2, tags, branches = asyncio.run(process_all())
+        expected, _ = self._load_test_file("gnome-calculator-test1.yaml",
+                                           get_gnome_calculator_tags())[0].process_parts()
+        assert result1 == (expected, False)
+        assert result2 == (expected, False)
+        assert [tag["name"] for tag in tags] == ["44.0", "43.0.1", "43.0"]
+        assert branches is None
+
+        # the parts of a snap are processed at the same time
+        data = self._base_load_test_file("gnome-boxes-test1.yaml")
+        pose = GitPose()
+        pose.set_branches(get_gnome_boxes_branches())
+        snap = Snapcraft(True, pose, pose, pose)
+        snap.set_full_silent()
+        snap.load_external_data(data)
+        expected = snap.process_parts()
+        snap.set_jobs(4)
+        assert asyncio.run(snap.process_parts_async()) == expected
+        assert asyncio.run(Snapcraft(True).process_parts_async()) == Snapcraft(True).process_parts()
+
+    def test_git_smart_http(self):
+        """ Checks that the tags and branches of any GIT repository are
+            obtained from the reference advertisement of the smart HTTP
+            protocol, using 'git http-backend' as server """
+        with tempfile.TemporaryDirectory() as git_folder:
+            create_test_repository(os.path.join(git_folder, "project.git"))
+            GitBackendStandIn.project_root = git_folder
+            with run_stand_in(GitBackendStandIn) as server_uri:
+                uri = f"{server_uri}/project.git"
+                gitobj = GitSmartHTTP(silent=True)
+                gitobj.set_full_silent()
+                refs = gitobj.get_refs(uri)
+                tags = gitobj.get_tags(uri)
+                branches = gitobj.get_branches(uri)
+                data = ("name: test\nparts:\n  project:\n    source: "
+                        f"{uri}\n    source-tag: '1.0'\n    source-depth: 1\n")
+                snap = Snapcraft(True)
+                snap.set_full_silent()
+                snap.load_external_data(data)
+                parts, tag_error = snap.process_parts()
+                with self.assertRaises(ConnectionError):
+                    gitobj.get_tags(f"{server_uri}/missing.git")
+        assert sorted(tag["name"] for tag in tags) == ["1.0", "1.1", "1.2"]
+        assert sorted(branch["name"] for branch in branches) == ["main", "stable"]
+        # annotated tags point to the commit, not to the tag object
+        assert refs["refs/tags/1.1"] == refs["refs/heads/main"]
+        assert refs["refs/tags/1.0"] == refs["refs/heads/stable"]
+        assert all(tag["date"] is None for tag in tags)
+        assert not tag_error
+        assert [tag["name"] for tag in parts[0]["updates"]] == ["1.2", "1.1"]
+
+    def test_parallel_parts(self):
+        """ Checks that the parts processed in parallel return the same
+            results, in the same order, and that the messages of each part
+            are printed together """
+        snap, _, _, _ = self._load_test_file("gnome-boxes-test1.yaml",
+                                             None,
+                                             get_gnome_boxes_branches())
+        expected = snap.process_parts()
+        data = self._base_load_test_file("gnome-boxes-test1.yaml")
+        pose = GitPose()
+        pose.set_branches(get_gnome_boxes_branches())
+        snap = Snapcraft(True, pose, pose, pose)
+        snap.load_external_data(data)
+        snap.set_jobs(4)
+        output = io.StringIO()
+        with contextlib.redirect_stderr(output):
+            result = snap.process_parts()
+        assert result == expected
+        headers = re.findall("Part: .*", output.getvalue())
+        assert len(headers) > 1
+        assert len(set(headers)) == len(headers)
+
+    def test_backend_messages_buffered(self):
+        """ Checks that the messages of the GIT backends, also those of
+            their workers, go to the buffer of the part being processed """
+        # pylint: disable=protected-access
+        snap = Snapcraft(True)
+        gitobj = Gitlab(silent=False)
+        gitobj.set_max_workers(2)
+        output = io.StringIO()
+
+        def get_uri(repository):
+            try:
+                gitobj._get_uri(repository, 1)
+            except ValueError:
+                pass
+            return output.getvalue()
+
+        def ask_all():
+            return gitobj._map_concurrent(get_uri, ["ftp://host1/a", "ftp://host2/b"])
+
+        with contextlib.redirect_stderr(output):
+            printed = snap._call_buffered(ask_all)
+        # nothing was printed until the end
+        assert printed == ["", ""]
+        assert "Unrecognized protocol in repository ftp://host1/a" in output.getvalue()
+        assert "Unrecognized protocol in repository ftp://host2/b" in output.getvalue()
+
+    def test_part_listener(self):
+        """ Checks that the listener is called once for each part, as soon
+            as it ends, also when the parts are processed in parallel """
+        data = self._base_load_test_file("gnome-boxes-test1.yaml")
+        pose = GitPose()
+        pose.set_branches(get_gnome_boxes_branches())
+        snap = Snapcraft(True, pose, pose, pose)
+        snap.set_full_silent()
+        snap.load_external_data(data)
+        snap.set_jobs(4)
+        records = []
+        snap.set_part_listener(lambda *record: records.append(record))
+        parts, _ = snap.process_parts()
+        assert len(records) == len(parts)
+        assert sorted(record[1] for record in records) == sorted(snap.get_part_names())
+        for snap_name, part, result, elapsed in records:
+            assert snap_name == "gnome-boxes"
+            assert result == parts[snap.get_part_names().index(part)]
+            assert elapsed >= 0
+
+    def test_upstream_index(self):
+        """ Checks that the data of each upstream repository is asked only
+            once, even by several snaps or by several threads at the same time """
+        index = UpstreamIndex()
+        calls = []
+        barrier = threading.Barrier(4)
+
+        def loader():
+            calls.append(1)
+            return ["1.0"]
+
+        def lookup(uri):
+            barrier.wait()
+            return index.get("tags", uri, loader, "1.0", {"format": "%M.%m"})
+
+        uris = ["https://github.com/GNOME/glib.git", "https://github.com/GNOME/glib",
+                "http://www.GitHub.com/GNOME/glib/", "git://github.com/GNOME/glib.git"]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lookup, uris))
+        assert results == [["1.0"]] * 4
+        assert len(calls) == 1
+        assert index.get_stats() == {"hits": 3, "misses": 1}
+        assert index.get("tags", uris[0], loader, "1.1", {"format": "%M.%m"}) == ["1.0"]
+        assert len(calls) == 2
+
+        # the adopt-info part and a second snap with the same source reuse the tags
+        snap1, _, github_pose, gitlab_pose = self._load_test_file(
+            "gnome-calculator-test1.yaml", get_gnome_calculator_tags())
+        snap2, _, github_pose2, gitlab_pose2 = self._load_test_file(
+            "gnome-calculator-test1.yaml", get_gnome_calculator_tags())
+        snap2.set_index(index)
+        snap1.set_index(index)
+        snap1.process_parts()
+        snap1.process_metadata()
+        snap2.process_parts()
+        assert github_pose.tag_requests + gitlab_pose.tag_requests == 1
+        assert github_pose2.tag_requests + gitlab_pose2.tag_requests == 0
+
+    def test_incremental_state(self):
+        """ Checks that a part is evaluated again only if its upstream tags
+            changed since the last run, and that the probes are conditional """
+        # pylint: disable=protected-access
+        with tempfile.TemporaryDirectory() as folder:
+            repository = os.path.join(folder, "project.git")
+            create_test_repository(repository)
+            GitBackendStandIn.project_root = folder
+            with run_stand_in(GitBackendStandIn) as server_uri:
+                state_path = os.path.join(folder, "state.json")
+                data = ("name: test\nparts:\n  project:\n    source: "
+                        f"{server_uri}/project.git\n"
+                        "    source-tag: '1.0'\n    source-depth: 1\n")
+
+                def run():
+                    GitBackendStandIn.requests = 0
+                    state = PartState(state_path)
+                    snap = Snapcraft(True)
+                    snap.set_full_silent()
+                    snap.set_state(state)
+                    snap.load_external_data(data)
+                    parts, _ = snap.process_parts()
+                    state.save()
+                    return [tag["name"] for tag in parts[0]["updates"]], GitBackendStandIn.requests
+
+                first = run()
+                second = run()
+                subprocess.run(["git", "-C", repository, "tag", "1.3", "main"], check=True)
+                third = run()
+        # the probe and the tags
+        assert first == (["1.2", "1.1"], 2)
+        # only the probe
+        assert second == (["1.2", "1.1"], 1)
+        assert third == (["1.3", "1.2", "1.1"], 2)
+
+        with run_stand_in(ETagStandIn) as server_uri:
+            gitobj = Gitlab(silent=True)
+            gitobj.set_full_silent()
+            uri = f"{server_uri}/tags"
+            probe = gitobj._probe_uri(uri, None)
+            second_probe = gitobj._probe_uri(uri, probe)
+        assert "If-None-Match" in probe["validators"]
+        # the server answered with a 304, so the previous probe is still valid
+        assert second_probe is probe
+
+    def test_probe_index(self):
+        """ Checks that Github isn't probed with the first page of tags, and
+            that each repository is probed only once, whatever the
+            validators of each part """
+        # pylint: disable=protected-access
+        assert Github(silent=True).probe_tags("https://github.com/GNOME/gnome-calculator.git") \
+            is None
+        pose = ProbePose()
+        snap = Snapcraft(True, pose, GitPose(), GitPose())
+        previous = {"fingerprint": "b", "validators": {"If-None-Match": "b"}}
+        snap._probe_tags("https://github.com/GNOME/gnome-calculator.git", None)
+        snap._probe_tags("https://github.com/GNOME/gnome-calculator.git", None)
+        snap._probe_tags("https://github.com/GNOME/gnome-calculator.git", previous)
+        assert pose.probes == [None]
+
+    def test_shared_tags(self):
+        """ Checks that the parts with the same source share its tags,
+            whatever their current tag and version format, that they are
+            read again only if a part needs an older tag, and that the
+            metadata reuses the result of the adopt-info part """
+        source = "https://github.com/GNOME/gnome-calculator.git"
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        snap = Snapcraft(True, gitobj, GitPose(), GitPose())
+        snap.set_full_silent()
+        data = "name: test\nadopt-info: part1\nparts:\n"
+        for name, tag, version_format in [("part1", "43.0", "%M.%m"),
+                                          ("part2", "44.0", "%M.%m.%R"),
+                                          ("part3", "43.alpha", "%M.%V")]:
+            data += (f"  {name}:\n    source: {source}\n    source-tag: '{tag}'\n"
+                     "    source-depth: 1\n    version-format:\n"
+                     f"      format: '{version_format}'\n")
+        snap.load_external_data(data)
+        processed = []
+        snap.set_part_listener(lambda snap_name, part, result, seconds: processed.append(part))
+        parts, _ = snap.process_parts()
+        assert [tag["name"] for tag in parts[0]["updates"]] == ["44.0"]
+        assert parts[1]["updates"] == []
+        assert parts[2]["updates"][0]["name"] == "44.0"
+        # the dates of the first five tags, and all of them again for part3
+        assert len(gitobj.requested_commits) == 5 + 7
+        assert snap.process_metadata()["upstream-version"] == "44.0"
+        assert processed == ["part1", "part2", "part3"]
+
+    def test_version_format(self):
+        """ Checks that the compiled version formats read the numbers like
+            the original parser: greedily, and ignoring the trailing text """
+        assert VersionFormat("%M.%m.%R").match("3.42.1") == (3, 42, 1)
+        assert VersionFormat("v%M.%m.%R").match("3.42.1") is None
+        assert VersionFormat("%M.%m").match("43.0.1") == (43, 0, 0)
+        assert VersionFormat("%M%m").match("431") is None
+        assert VersionFormat("%M0.%m").match("10.2") is None
+        assert VersionFormat("gtk-%M_%m").match("gtk-4_12") == (4, 12, 0)
+        assert VersionFormat("%M+%m").match("4+12") == (4, 12, 0)
+        assert VersionFormat("v%V").get_variation("v1.0b2") == "1.0b2"
+        assert VersionFormat("v%V").get_variation("1.0") is None
+        assert get_version_format("%M.%m") is get_version_format("%M.%m")
+
+    def test_tag_model(self):
+        """ Checks that the backends return the tags with their version
+            already parsed, and that it is reused when sorting them """
+        # pylint: disable=protected-access
+        gitobj = GithubPose(get_gnome_calculator_tags())
+        gitobj.set_full_silent()
+        tags = gitobj.get_tags("https://github.com/GNOME/gnome-calculator.git",
+                               "43.0", {"format": "%M.%m"})
+        assert tags[0].version == parse_version("44.0")
+        assert tags[0]["name"] == tags[0].name == "44.0"
+        assert tags[0].get("sha") == "sha-44.0"
+        assert "version" in tags[0]
+        assert Tag("1.0").get("date", 0) == 0
+        with self.assertRaises(KeyError):
+            _ = tags[0]["other"]
+
+        snap = Snapcraft(True)
+        snap.set_full_silent()
+        part_data = {"version_format": {"format": "%M.%m"}, "updates": []}
+        # a name that doesn't follow the format, to check that it isn't parsed again
+        newer = Tag("latest", datetime.datetime(2024, 1, 1), "sha", parse_version("99.0"))
+        snap._sort_tags("part", "43.0", [newer] + tags, part_data)
+        assert [tag.name for tag in part_data["updates"]] == ["latest", "44.0"]
+
+    def test_newer_tags(self):
+        """ Checks that the newer tags are filtered with the rules of the
+            version format and sorted by date """
+        # pylint: disable=protected-access
+        generator = random.Random(0)
+        tags = [Tag(f"{generator.randint(0, 4)}.{generator.randint(0, 95)}."
+                    f"{generator.randint(0, 95)}",
+                    datetime.datetime(2020, 1, generator.randint(1, 9)))
+                for _ in range(500)] + [Tag("2.10.3", datetime.datetime(2020, 1, 5)),
+                                        Tag("latest", None)]
+        snap = Snapcraft(True)
+        snap.set_full_silent()
+        entry_formats = [{"format": "%M.%m.%R"},
+                         {"format": "%M.%m", "ignore-odd-minor": True, "lower-than": "4"},
+                         {"format": "%M.%m.%R", "no-9x-revisions": True, "no-9x-minors": True,
+                          "ignore-version": ["3.2.1", "1.4"], "same-major": True},
+                         {"format": "%M.%m.%R", "ignore-version": "2.11.0", "same-minor": True}]
+        for entry_format in entry_formats:
+            versions = [snap._get_version("", tag.name, entry_format, False) for tag in tags]
+            current_version = snap._get_version("", "2.10.3", entry_format, False)
+            expected = [tag for tag, version in zip(tags, versions)
+                        if (version is not None) and (version > current_version) and
+                        ((not entry_format.get("same-major")) or
+                         (version.major == current_version.major)) and
+                        ((not entry_format.get("same-minor")) or
+                         (version.minor == current_version.minor))]
+            expected.sort(reverse=True, key=snap._date_key)
+            assert snap._get_newer_tags("", tags[-2], tags, entry_format) == expected
+
+    def test_tag_ranking(self):
+        """ Checks that the packed columns select and sort the same tags
+            than checking them one by one, and that they can pick the
+            newest ones without sorting the candidates """
+        # pylint: disable=protected-access,too-many-locals
+        generator = random.Random(1)
+        snap = Snapcraft(True)
+        snap.set_full_silent()
+        names = ["{}.{}.{}", "{}.{}", "v{}.{}.{}", "{}.{}.{}.0", "{}_{}", "foo-{}"]
+        options = {"ignore-odd-minor": True, "no-9x-revisions": True, "no-9x-minors": True,
+                   "same-major": True, "same-minor": True, "lower-than": "3.50",
+                   "ignore-version": ["2.10", "1.3.5", "1.2.3.4"]}
+        ranked = 0
+        for _ in range(500):
+            entry_format = {"format": generator.choice(["%M.%m.%R", "%M.%m", "v%M.%m.%R"])}
+            for option in generator.sample(sorted(options), generator.randint(0, 4)):
+                entry_format[option] = options[option]
+            tags = []
+            for _ in range(generator.randint(1, 60)):
+                name = generator.choice(names).format(*[generator.choice([0, 1, 2, 3, 10, 91])
+                                                        for _ in range(3)])
+                date = generator.choice([None, datetime.datetime(2020, 1, generator.randint(1, 5))])
+                version = None
+                if generator.random() < 0.2:
+                    # a version already parsed by the backend
+                    version = snap._get_version("", name, entry_format, False)
+                tags.append(Tag(name, date, None, version))
+            if generator.random() < 0.1:
+                tags.append(Tag("3000000.1.0", None))
+            versions = TagRanking(entry_format).get_versions([tag.name for tag in tags])
+            # too big numbers can't be packed
+            assert versions in [None, [snap._get_version("", tag.name, entry_format, False)
+                                       for tag in tags]]
+            current = generator.choice(tags)
+            if snap._get_tag_version("", current, entry_format) is None:
+                continue
+            newer = snap._rank_newer_tags(current, tags, entry_format)
+            expected = snap._filter_newer_tags("", current, tags, entry_format)
+            assert snap._get_newer_tags("", current, tags, entry_format) == expected
+            if newer is None:
+                continue
+            ranked += 1
+            assert newer == expected
+            ranking = TagRanking(entry_format)
+            columns = ranking.pack([tag.name for tag in tags], [tag.version for tag in tags],
+                                   [tag.date for tag in tags])
+            top = ranking.get_newer(columns, ranking.get_current(columns, tags.index(current)),
+                                    exclude=bytes(map(current.name.__eq__,
+                                                      [tag.name for tag in tags])),
+                                    same_major=bool(entry_format.get("same-major")),
+                                    same_minor=bool(entry_format.get("same-minor")),
+                                    by_date=current.date is not None, count=2)
+            assert [tags[index] for index in top] == expected[:2]
+        assert ranked > 100
+
     def test_branches(self):
         """ Check that using branches in a part instead of tags does work """
         snap, _, _, _ = self._load_test_file("gnome-boxes-test1.yaml",
@@ -214,6 +854,53 @@ class TestYAMLfiles(unittest.TestCase):
                     break
             assert found
 
+    def test_recent_branches(self):
+        """ Checks that, for a branch, only the first pages of branches
+            sorted by date are read, and that they are enough to find the
+            newer branches and the most recent ones """
+        branches = {f"branch-{index}": f"2023-{1 + index % 12:02}-{1 + index // 12:02}T10:00:00Z"
+                    for index in range(100)}
+        gitobj = GitlabPose(branches)
+        gitobj.set_full_silent()
+        repository = "https://gitlab.gnome.org/GNOME/gnome-boxes.git"
+        full_list = gitobj.get_branches(repository)
+        gitobj.requests = []
+        recent = gitobj.get_recent_branches(repository, "branch-94")
+        assert len(gitobj.requests) == 2
+        assert len(recent) < 20
+        # pylint: disable=protected-access
+        current = Gitlab._parse_branch_date(branches["branch-94"])
+        assert (sorted(branch["name"] for branch in recent if branch["date"] > current) ==
+                sorted(branch["name"] for branch in full_list if branch["date"] > current))
+        assert "branch-94" in [branch["name"] for branch in recent]
+        top = sorted(full_list, reverse=True, key=lambda branch: branch["date"])[:4]
+        assert [branch["name"] for branch in recent[:4]] == [branch["name"] for branch in top]
+        # without a branch, only the most recent ones are read
+        gitobj.requests = []
+        recent = gitobj.get_recent_branches(repository)
+        assert len(gitobj.requests) == 1
+        assert [branch["name"] for branch in recent] == [branch["name"] for branch in top]
+        # the oldest branch needs all the pages
+        gitobj.requests = []
+        recent = gitobj.get_recent_branches(repository, "branch-0")
+        assert len(recent) == 100
+        assert gitobj.get_recent_branches("https://github.com/GNOME/gnome-boxes.git",
+                                          "main") is None
+        # the dates are compared as dates, not as text, even with different offsets
+        branches = {f"branch-{index}": f"2023-01-01T{index:02}:00:00+00:00"
+                    for index in range(20)}
+        branches["main"] = "2023-01-01T10:00:00+00:00"
+        branches["newer"] = "2023-01-01T08:30:00-03:00"
+        gitobj = GitlabPose(branches)
+        gitobj.set_full_silent()
+        recent = gitobj.get_recent_branches(repository, "main")
+        assert "newer" in [branch["name"] for branch in recent]
+        snap = Snapcraft(True, GitPose(), gitobj, GitPose())
+        snap.set_full_silent()
+        newer = snap._sort_elements("part", "main", gitobj.get_branches(repository), "")
+        assert [branch["name"] for branch in newer] == (
+            [f"branch-{index}" for index in range(19, 11, -1)] + ["newer", "branch-11"])
+
     def test_branch_no_permission(self):
         """ Checks that a file using source-branch without permission triggers
             an error """
@@ -317,6 +1004,98 @@ class TestYAMLfiles(unittest.TestCase):
         assert 'separator' in element
         assert element['separator'] == '    '
 
+    def test_big_yaml(self):
+        """ Checks that a big file, with blocks that end at several levels
+            at once, is split in the right tree and rebuilt without changes """
+        contents = generate_snapcraft(20000)
+        yaml_obj = ManageYAML(contents)
+        # the blank lines at the end are removed
+        assert yaml_obj.get_yaml() == contents.rstrip() + "\n"
+        output = io.StringIO()
+        yaml_obj.write_yaml(output)
+        assert output.getvalue() == contents.rstrip() + "\n"
+        assert "".join(yaml_obj.iter_yaml(7)) == output.getvalue()
+        parts = yaml_obj.get_part_metadata("parts")["child"]
+        assert len([entry for entry in parts if entry["level"] == 1]) == 1111
+        version_format = yaml_obj.get_part_element("part1110", "update-context")
+        assert version_format["child"][0]["child"][0]["data"] == "format: '%M.%m'"
+        assert version_format["child"][0]["child"][0]["level"] == 4
+
+    def test_yaml_path_index(self):
+        """ Checks that the entries can be found by their path, and that
+            several of them can be updated at once """
+        data = self._base_load_test_file("gnome-calculator-test1.yaml")
+        yaml_obj = ManageYAML(data)
+        path = ("parts", "gnome-calculator", "source-tag")
+        entry = yaml_obj.get_entry(path)
+        assert entry is yaml_obj.get_part_element("gnome-calculator", "source-tag:")
+        assert yaml_obj.get_entry(("apps", "gnome-calculator", "command"))["data"] == \
+            "command: usr/bin/gnome-calculator"
+        missing = yaml_obj.apply_updates({path: "'44.0'",
+                                          ("parts", "gnome-calculator", "source-depth"): "2",
+                                          ("parts", "other-part", "source-tag"): "'1.0'"})
+        assert missing == [("parts", "other-part", "source-tag")]
+        assert entry["data"] == "source-tag: '44.0'"
+        assert yaml_obj.get_yaml() == data.replace("source-tag: '42.2'", "source-tag: '44.0'")\
+            .replace("source-depth: 1", "source-depth: 2")
+
+    def test_yaml_patch(self):
+        """ Checks that the updates can be applied to the original text,
+            keeping the rest of it untouched, and shown as an unified diff """
+        data = self._base_load_test_file("gnome-calculator-test1.yaml")
+        # the trailing blank lines are removed when the file is generated again
+        data += "\n\n"
+        yaml_obj = ManageYAML(data)
+        assert yaml_obj.get_patched_yaml() == data
+        assert yaml_obj.get_diff() == ""
+        yaml_obj.apply_updates({("parts", "gnome-calculator", "source-tag"): "'44.0'"})
+        patched = data.replace("source-tag: '42.2'", "source-tag: '44.0'")
+        assert yaml_obj.get_patched_yaml() == patched
+        assert yaml_obj.get_yaml() == patched.rstrip() + "\n"
+        line = data.split("\n").index("    source-tag: '42.2'")
+        diff = yaml_obj.get_diff("snapcraft.yaml", context=1).split("\n")
+        assert diff == ["--- a/snapcraft.yaml", "+++ b/snapcraft.yaml",
+                        f"@@ -{line},3 +{line},3 @@",
+                        " " + data.split("\n")[line - 1],
+                        "-    source-tag: '42.2'",
+                        "+    source-tag: '44.0'",
+                        " " + data.split("\n")[line + 1],
+                        ""]
+
+    def test_shared_yaml_parse(self):
+        """ Checks that Snapcraft can use the data already loaded by
+            ManageYAML, including the extension blocks, and that each
+            part is linked to its entries """
+        # pylint: disable=protected-access
+        data = self._base_load_test_file("gnome-calculator-test1.yaml")
+        yaml_obj = ManageYAML(data)
+        config, has_extensions = yaml_obj.get_config()
+        assert has_extensions
+        assert config["parts"]["gnome-calculator"]["version-format"] == {"no-9x-revisions": True}
+        # each call returns new data, so changing it doesn't affect others
+        config["parts"]["gnome-calculator"]["version-format"]["format"] = "%M.%m"
+        assert yaml_obj.get_config()[0]["parts"]["gnome-calculator"]["version-format"] == \
+            {"no-9x-revisions": True}
+        snap = Snapcraft(True)
+        snap.set_full_silent()
+        snap.load_manage_yaml(yaml_obj)
+        snap2 = Snapcraft(True)
+        snap2.set_full_silent()
+        snap2.load_external_data(data)
+        assert snap._config == snap2._config
+        for part_name, part in snap._config["parts"].items():
+            entry = yaml_obj.get_part_entry(part_name, "source")
+            if "source" not in part:
+                assert entry is None
+                continue
+            assert entry["data"] == f"source: {part['source']}"
+        assert yaml_obj.get_part_entry("gnome-calculator", "source-tag")["data"] == \
+            "source-tag: '42.2'"
+        assert yaml_obj.update_part_element("gnome-calculator", "source-tag", "'44.0'")
+        assert not yaml_obj.update_part_element("other-part", "source-tag", "'44.0'")
+        assert yaml_obj.get_patched_yaml() == data.replace("source-tag: '42.2'",
+                                                           "source-tag: '44.0'")
+
     def test_no_true_or_false_on_option(self):
         """ Checks if the file doesn't follow the right format """
         data = self._base_load_test_file("snapcraft_no_true_false.yaml")
@@ -480,12 +1259,15 @@ class GitPose:
     """ Helper class. It emulates a GitClass class, to allow to test
         classes that depend on it, without having to rely on an external
         github or gitlab repository """
+    tags_sorted_by_date = False
+
     def __init__(self):
         self._tags = {}
         self._branches = {}
         self._uri_error = None
         self._silent = True
         self._full_silent = False
+        self.tag_requests = 0
 
     def set_full_silent(self):
         """ Implements the method to avoid errors. """
@@ -510,6 +1292,7 @@ class GitPose:
     def get_tags(self, source, current_tag=None, version_format=None):
         # pylint: disable=unused-argument
         """ Implements the get_tags() method of GitClass """
+        self.tag_requests += 1
         if self._uri_error is not None:
             raise self._uri_error
         if self._tags is None:
@@ -518,6 +1301,10 @@ class GitPose:
             return self._tags[source]
         return []
 
+    def iter_tags(self, source, current_tag=None, version_format=None):
+        """ Implements the iter_tags() method of GitClass """
+        return iter(self.get_tags(source, current_tag, version_format))
+
     def get_branches(self, source):
         """ Implements the get_branches() method of GitClass """
         if self._branches is None:
@@ -526,6 +1313,299 @@ class GitPose:
             return self._branches[source]
         return []
 
+    def get_recent_branches(self, source, branch, count=4):
+        # pylint: disable=unused-argument
+        """ Implements the get_recent_branches() method of GitClass. The
+            whole list is always used. """
+        return None
+
+
+class ProbePose(GitPose):
+    """ Helper class. It works like GitPose, but also records the probes """
+    def __init__(self):
+        super().__init__()
+        self.probes = []
+
+    def probe_tags(self, source, previous=None):
+        # pylint: disable=unused-argument
+        """ Records the validators of the probe and returns a fingerprint """
+        self.probes.append(previous)
+        return {"fingerprint": "a", "validators": {}}
+
+
+class GithubPose(Github):
+    """ Helper class. It emulates the REST API of Github, to allow to test
+        the Github class without accessing the network """
+    def __init__(self, tags):
+        super().__init__(silent=True)
+        self._tags = {}
+        for source, tag_list in tags.items():
+            self._tags[source.replace("gitlab.gnome.org", "github.com")] = tag_list
+        self.requested_commits = []
+
+    def _iter_pages(self, uri: str):
+        for source, tag_list in self._tags.items():
+            if uri.find(source[len("https://github.com/"):-len(".git")]) == -1:
+                continue
+            yield [{"name": tag["name"],
+                    "commit": {"sha": f"sha-{tag['name']}", "url": tag["name"]}}
+                   for tag in tag_list]
+
+    def _read_page(self, uri: str):
+        self.requested_commits.append(uri)
+        for tag_list in self._tags.values():
+            for tag in tag_list:
+                if tag["name"] != uri:
+                    continue
+                date = tag["date"].strftime("%Y-%m-%dT%H:%M:%SZ")
+                return {"commit": {"author": {"date": date}}}
+        return None
+
+
+class GitlabPose(Gitlab):
+    """ Helper class. It emulates the branches in the REST API of Gitlab,
+        returning them in pages of ten, and counting the requests """
+    def __init__(self, branches):
+        super().__init__(silent=True)
+        self._branches = branches
+        self.requests = []
+
+    def _read_page_with_headers(self, uri: str):
+        self.requests.append(uri)
+        parsed = urllib.parse.urlparse(uri)
+        name = urllib.parse.unquote(parsed.path.split("/repository/branches")[1][1:])
+        branches = [{"name": branch, "commit": {"created_at": date}}
+                    for branch, date in self._branches.items()]
+        if name:
+            return [entry for entry in branches if entry["name"] == name][0], {}
+        if "sort=updated_desc" in parsed.query:
+            branches.sort(reverse=True, key=lambda entry: datetime.datetime.fromisoformat(
+                entry["commit"]["created_at"].replace("Z", "+00:00")))
+        query = urllib.parse.parse_qs(parsed.query)
+        page = int(query.get("page", ["1"])[0])
+        headers = requests.structures.CaseInsensitiveDict()
+        if page * 10 < len(branches):
+            query["page"] = [str(page + 1)]
+            next_uri = parsed._replace(query=urllib.parse.urlencode(query, doseq=True)).geturl()
+            headers["Link"] = f'<{next_uri}>; rel="next"'
+        return branches[(page - 1) * 10:page * 10], headers
+
+
+class GraphQLStandIn(http.server.BaseHTTPRequestHandler):
+    """ Helper class. It emulates the Github GraphQL endpoint, returning
+        the tags of the gnome-calculator project in pages of five tags """
+    queries = 0
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        """ Avoids printing each request in the tests output """
+
+    def do_POST(self):
+        # pylint: disable=invalid-name
+        """ Answers a query for the tags of a repository """
+        GraphQLStandIn.queries += 1
+        query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        variables = query["variables"]
+        result = {"data": {"repository": None}}
+        if variables["name"] == "gnome-calculator":
+            tags = get_gnome_calculator_tags()[
+                "https://gitlab.gnome.org/GNOME/gnome-calculator.git"]
+            start = int(variables["cursor"]) if variables["cursor"] else 0
+            nodes = []
+            for index, tag in enumerate(tags[start:start + 5]):
+                target = {"oid": f"commit-{tag['name']}",
+                          "committedDate": tag["date"].astimezone(
+                              datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+                if index % 2 == 1:
+                    # emulate an annotated tag
+                    target = {"oid": f"tag-{tag['name']}", "target": target}
+                nodes.append({"name": tag["name"], "target": target})
+            result["data"]["repository"] = {"refs": {
+                "pageInfo": {"hasNextPage": start + 5 < len(tags), "endCursor": str(start + 5)},
+                "nodes": nodes}}
+        content = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class ETagStandIn(http.server.BaseHTTPRequestHandler):
+    """ Helper class. It emulates a REST API that returns two pages of
+        tags, with an ETag that allows to revalidate them """
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        """ Avoids printing each request in the tests output """
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Answers with a page of tags, or with a 304 if it didn't change """
+        if self.path.endswith("page=2"):
+            content = json.dumps([{"name": "1.0"}]).encode("utf-8")
+        else:
+            content = json.dumps([{"name": "1.2"}, {"name": "1.1"}]).encode("utf-8")
+        etag = f'"{len(content)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", etag)
+        if not self.path.endswith("page=2"):
+            self.send_header("Link", f'<http://{self.headers["Host"]}/tags?page=2>; rel="next"')
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class RateLimitStandIn(ETagStandIn):
+    """ Helper class. It works like ETagStandIn, but rejects the first
+        requests with a '429 Too Many Requests', or with other status code """
+    rejections = 0
+    status = 429
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Rejects the request, or answers with a page of tags """
+        if RateLimitStandIn.rejections > 0:
+            RateLimitStandIn.rejections -= 1
+            self.send_response(RateLimitStandIn.status)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_GET()
+
+
+class PagesStandIn(ETagStandIn):
+    """ Helper class. It emulates a REST API that returns five pages of
+        tags, with a Link header that includes the last page """
+    requested_pages = []
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Answers with the requested page of tags """
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        page = int(query.get("page", "1"))
+        PagesStandIn.requested_pages.append(page)
+        content = json.dumps([{"name": f"{6 - page}.1"},
+                              {"name": f"{6 - page}.0"}]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if page < 5:
+            base = f"http://{self.headers['Host']}/tags?sort=desc"
+            self.send_header("Link", f'<{base}&page={page + 1}>; rel="next", '
+                             f'<{base}&page=1>; rel="first", <{base}&page=5>; rel="last"')
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class SlowPagesStandIn(PagesStandIn):
+    """ Helper class. It works like PagesStandIn, but the third page takes
+        a while, and the start and the end of each request are recorded """
+    events = []
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Answers with the requested page of tags """
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        page = int(query.get("page", "1"))
+        SlowPagesStandIn.events.append(("start", page))
+        if page == 3:
+            time.sleep(0.5)
+        super().do_GET()
+        SlowPagesStandIn.events.append(("end", page))
+
+
+class KeepAliveStandIn(ETagStandIn):
+    """ Helper class. It works like ETagStandIn, but keeps the connections
+        alive, and stores the port of each client that connects to it """
+    protocol_version = "HTTP/1.1"
+    client_ports = set()
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Stores the client port and answers with a page of tags """
+        KeepAliveStandIn.client_ports.add(self.client_address[1])
+        super().do_GET()
+
+
+class GitBackendStandIn(http.server.BaseHTTPRequestHandler):
+    """ Helper class. It serves the GIT repositories in a folder with
+        the smart HTTP protocol, running 'git http-backend' as a CGI """
+    project_root = None
+    requests = 0
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        """ Avoids printing each request in the tests output """
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """ Runs 'git http-backend' and returns its output """
+        GitBackendStandIn.requests += 1
+        uri = urllib.parse.urlparse(self.path)
+        environment = dict(os.environ, GIT_PROJECT_ROOT=GitBackendStandIn.project_root,
+                           GIT_HTTP_EXPORT_ALL="1", REQUEST_METHOD="GET",
+                           PATH_INFO=uri.path, QUERY_STRING=uri.query)
+        output = subprocess.run(["git", "http-backend"], env=environment,
+                                capture_output=True, check=True).stdout
+        headers, content = output.split(b"\r\n\r\n", 1)
+        status = 200
+        header_list = []
+        for header in headers.decode("utf-8").split("\r\n"):
+            name, value = header.split(":", 1)
+            if name == "Status":
+                status = int(value.split()[0])
+            else:
+                header_list.append((name, value.strip()))
+        self.send_response(status)
+        for name, value in header_list:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@contextlib.contextmanager
+def run_stand_in(handler):
+    """ Helper function. Serves one of the stand-in handlers in a thread
+        while the context is active, and yields the base URI of the server """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def create_test_repository(path):
+    """ Creates a bare GIT repository with the branches 'stable' and 'main',
+        a lightweight tag 1.0 in 'stable', and the annotated tags 1.1 and
+        1.2 in 'main' """
+    environment = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@test",
+                       GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@test")
+
+    def git(*args):
+        return subprocess.run(["git", "-C", path] + list(args), check=True, text=True,
+                              capture_output=True, env=environment).stdout.strip()
+
+    subprocess.run(["git", "init", "-q", "--bare", path], check=True)
+    empty_tree = git("hash-object", "-t", "tree", "-w", "/dev/null")
+    first = git("commit-tree", "-m", "first", empty_tree)
+    second = git("commit-tree", "-m", "second", "-p", first, empty_tree)
+    git("update-ref", "refs/heads/stable", first)
+    git("update-ref", "refs/heads/main", second)
+    git("symbolic-ref", "HEAD", "refs/heads/main")
+    git("tag", "1.0", first)
+    git("tag", "-a", "-m", "1.1", "1.1", second)
+    git("tag", "-a", "-m", "1.2", "1.2", second)
+
 
 def get_gnome_boxes_branches():
     """ Returns a plausible list of branches for several tests """
@@ -3,10 +3,22 @@
 """ Analizes a YAML file and shows the available updates for each part """
 
 import argparse
+import datetime
+import json
 import sys
 import os
-import requests
-from SnapModule.snapmodule import Snapcraft
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from SnapModule.snapmodule import Snapcraft, Github, GithubGraphQL, Gitlab, GitSmartHTTP
+from SnapModule.httpsession import add_pool_arguments, configure_clients, get_client
+from SnapModule.httpcache import add_cache_arguments, new_cache
+from SnapModule.commitstore import new_commit_store
+from SnapModule.upstreamindex import UpstreamIndex
+from SnapModule.partstate import PartState
+
+
+# the records of several parts can end at the same time
+_output_lock = threading.Lock()
 
 
 def apply_local_secrets(snap, arguments):
@@ -18,10 +30,41 @@ def apply_local_secrets(snap, arguments):
         snap.set_secret("github", "token", arguments.github_token)
 
 
-def process_folder(folder_path, arguments) -> tuple[list, bool]:
+def new_backends(arguments) -> tuple:
+    """ Creates the Github, Gitlab and GIT backends selected in the
+        command line, to share them between several snap processors """
+
+    github = GithubGraphQL(arguments.s) if arguments.github_graphql else Github(arguments.s)
+    return github, Gitlab(arguments.s), GitSmartHTTP(arguments.s)
+
+
+def new_snapcraft(arguments, cache=None, commit_store=None, *, backends=None,
+                  index=None, state=None) -> Snapcraft:
+    # pylint: disable=too-many-arguments
+    """ Creates a snap processor object using the backends selected
+        in the command line """
+
+    if backends is None:
+        backends = new_backends(arguments)
+    snap = Snapcraft(arguments.s, *backends)
+    snap.set_jobs(arguments.jobs)
+    if index is not None:
+        snap.set_index(index)
+    snap.set_state(state)
+    if arguments.format == "ndjson":
+        snap.set_part_listener(write_part_record)
+    if cache is not None:
+        snap.set_cache(cache)
+    if commit_store is not None:
+        snap.set_commit_store(commit_store)
+    return snap
+
+
+def process_folder(folder_path, arguments, cache=None, commit_store=None,
+                   state=None) -> tuple[list, bool]:
     """ Processes a folder, searching for the snapcraft.yaml files """
 
-    snap = Snapcraft(arguments.s)
+    snap = new_snapcraft(arguments, cache, commit_store, state=state)
     snap.load_local_file(folder_path)
     apply_local_secrets(snap, arguments)
     if len(arguments.parts) >= 1:
@@ -32,10 +75,51 @@ def process_folder(folder_path, arguments) -> tuple[list, bool]:
     return snap.process_parts()
 
 
-def process_data(data, arguments) -> tuple[list, bool]:
+def find_snapcraft_files(folder_path) -> list:
+    """ Returns the path of every snapcraft.yaml file inside a folder and
+        its subfolders, including the ones inside 'snap' folders """
+
+    files = []
+    for root, folders, filenames in os.walk(folder_path):
+        # skip hidden folders like .git, and keep a stable order
+        folders[:] = sorted(folder for folder in folders if not folder.startswith('.'))
+        if "snapcraft.yaml" in filenames:
+            files.append(os.path.join(root, "snapcraft.yaml"))
+    return files
+
+
+def process_fleet(folder_path, arguments, cache=None, commit_store=None, state=None) -> list:
+    """ Processes every snapcraft.yaml file inside a folder. All the parts
+        of all the snaps are processed in a single pool of workers, sharing
+        the backends, the HTTP connections, the cache and the data of each
+        upstream repository. """
+
+    backends = new_backends(arguments)
+    index = UpstreamIndex()
+    tasks = []
+    for filename in find_snapcraft_files(folder_path):
+        snap_backends = backends
+        if Snapcraft.get_secrets_file(filename) != Snapcraft.get_secrets_file():
+            # the secrets are set in the backends, so a snap with its own
+            # secrets can't share them with the other snaps
+            snap_backends = new_backends(arguments)
+        snap = new_snapcraft(arguments, cache, commit_store, backends=snap_backends,
+                             index=index, state=state)
+        snap.load_local_file(filename)
+        apply_local_secrets(snap, arguments)
+        for part in snap.get_part_names():
+            if (len(arguments.parts) == 0) or (part in arguments.parts):
+                tasks.append((snap, part))
+    with ThreadPoolExecutor(max_workers=max(1, arguments.jobs)) as executor:
+        futures = [executor.submit(snap.process_part_buffered, part) for snap, part in tasks]
+        return [future.result() for future in futures]
+
+
+def process_data(data, arguments, cache=None, commit_store=None,
+                 state=None) -> tuple[list, bool]:
     """ Processed a YAML data passed in the data argument """
 
-    snap = Snapcraft(arguments.s)
+    snap = new_snapcraft(arguments, cache, commit_store, state=state)
     snap.load_external_data(data)
     apply_local_secrets(snap, arguments)
     if len(arguments.parts) >= 1:
@@ -46,6 +130,38 @@ def process_data(data, arguments) -> tuple[list, bool]:
     return snap.process_parts()
 
 
+def _to_json(element):
+    if isinstance(element, datetime.datetime):
+        return element.isoformat()
+    return str(element)
+
+
+def get_part_record(snap_name, part, result, elapsed) -> dict:
+    """ Returns the result of a part as a dictionary that can be stored
+        as JSON """
+    record = {"snap": snap_name, "part": part, "skipped": result is None,
+              "version": None, "version_date": None, "updates": [],
+              "use_tag": False, "use_branch": False, "missing_format": False,
+              "seconds": round(elapsed, 3)}
+    if result is None:
+        return record
+    if result["version"] is not None:
+        record["version"], record["version_date"] = result["version"]
+    record["updates"] = [{"name": update["name"], "date": update.get("date"),
+                          "sha": update.get("sha")} for update in result["updates"]]
+    for flag in ["use_tag", "use_branch", "missing_format"]:
+        record[flag] = result[flag]
+    return record
+
+
+def write_part_record(snap_name, part, result, elapsed):
+    """ Writes the result of a part as a line of JSON in the standard
+        output, as soon as the part ends """
+    line = json.dumps(get_part_record(snap_name, part, result, elapsed), default=_to_json)
+    with _output_lock:
+        print(line, flush=True)
+
+
 def print_summary(data):
     """ Prints the results of the process, specifying which parts have
         new versions available """
@@ -86,36 +202,56 @@ def main():
                         help='User name for accesing Github projects.')
     parser.add_argument('--github-token', action='store',
                         help='Access token for accesing Github projects.')
+    parser.add_argument('--github-graphql', action='store_true',
+                        help='Use the Github GraphQL API to get the tags (requires '
+                        'an user and a token).')
+    add_cache_arguments(parser)
+    add_pool_arguments(parser)
+    parser.add_argument('--jobs', action='store', type=int, default=1,
+                        help='Number of parts processed in parallel.')
+    parser.add_argument('--state', action='store',
+                        help='File where to keep the state of each part between runs, to '
+                        'evaluate again only the parts whose upstream tags changed.')
+    parser.add_argument('--format', action='store', choices=['text', 'ndjson'],
+                        default='text',
+                        help='Output format. With "ndjson", the result of each part is '
+                        'written as a line of JSON as soon as the part ends, instead '
+                        'of printing a summary at the end.')
     parser.add_argument('folder', default='.', help='The folder of the snapcraft project.')
     parser.add_argument('parts', nargs='*', help='A list of parts to check.')
     argument_list = parser.parse_args(sys.argv[1:])
+    configure_clients(pool_maxsize=argument_list.pool_size)
+    cache = new_cache(argument_list)
+    commit_store = new_commit_store(argument_list)
+    state = PartState(argument_list.state) if argument_list.state else None
 
     if argument_list.r:  # recursive
         if (argument_list.folder.startswith("http://") or
                 argument_list.folder.startswith("https://")):
             print("-r parameter can't be used with http or https. Aborting.", file=sys.stderr)
             sys.exit(-1)
-        retval = []
-        for folder in os.listdir(argument_list.folder):
-            full_path = os.path.join(argument_list.folder, folder)
-            if not os.path.isdir(full_path):
-                continue
-            data, _ = process_folder(full_path, argument_list)
-            retval += data
+        retval = process_fleet(argument_list.folder, argument_list, cache, commit_store, state)
     else:
         if ((not argument_list.folder.startswith("http://")) and
                 (not argument_list.folder.startswith("https://"))):
-            data, _ = process_folder(argument_list.folder, argument_list)
+            data, _ = process_folder(argument_list.folder, argument_list, cache, commit_store,
+                                     state)
             retval = data
         else:
-            response = requests.get(argument_list.folder, timeout=30)
+            response = get_client().get(argument_list.folder)
             if not response:
                 print(f"Failed to get the file {argument_list.folder}: {response.status_code}",
                       file=sys.stderr)
                 sys.exit(-1)
-            data, _ = process_data(response.content.decode('utf-8'), argument_list)
+            data, _ = process_data(response.content.decode('utf-8'), argument_list,
+                                   cache, commit_store, state)
             retval = data
-    print_summary(retval)
+    if argument_list.format == "text":
+        print_summary(retval)
+    if state is not None:
+        state.save()
+    if (cache is not None) and not argument_list.s:
+        print(cache.get_summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":
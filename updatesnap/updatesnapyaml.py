@@ -5,8 +5,12 @@
 import sys
 import argparse
 import logging
-from SnapModule.snapmodule import Snapcraft, Github
+from SnapModule.snapmodule import Snapcraft, Github, GithubGraphQL
 from SnapModule.manageYAML import ManageYAML
+from SnapModule.httpsession import add_pool_arguments, configure_clients
+from SnapModule.httpcache import add_cache_arguments, new_cache
+from SnapModule.commitstore import new_commit_store
+from SnapModule.partstate import PartState
 from SnapVersionModule.snap_version_module import is_version_update
 UPDATE_BRANCH = 'update_versions'
 
@@ -14,9 +18,10 @@ UPDATE_BRANCH = 'update_versions'
 class ProjectManager:
     """ This class is the one that searches in a remote project for
         the corresponding snapcraft.yaml file """
-    def __init__(self, user=None, token=None, verbose=False):
+    def __init__(self, user=None, token=None, verbose=False, cache=None):
         """ Constructor. """
         self._github = Github(not verbose)
+        self._github.set_cache(cache)
         if user:
             self._github.set_secret('user', user)
         if token:
@@ -57,8 +62,21 @@ class ProjectManager:
         return data
 
 
-def main():
-    """ Main code """
+def new_snapcraft(arguments, cache=None, state=None) -> Snapcraft:
+    """ Creates a snap processor object using the backends selected
+        in the command line """
+
+    github = GithubGraphQL(not arguments.verbose) if arguments.github_graphql else None
+    snap = Snapcraft(not arguments.verbose, github)
+    snap.set_state(state)
+    if cache is not None:
+        snap.set_cache(cache)
+        snap.set_commit_store(new_commit_store(arguments))
+    return snap
+
+
+def get_arguments():
+    """ Parses the command line arguments """
     parser = argparse.ArgumentParser(prog='Update Snap YAML',
                                      description='Find the lastest source'
                                      ' versions for snap files and generates a new snapcraft.yaml.')
@@ -66,17 +84,71 @@ def main():
                         help='User name for accesing Github projects.')
     parser.add_argument('--github-token', action='store', default=None,
                         help='Access token for accesing Github projects.')
+    parser.add_argument('--github-graphql', action='store_true', default=False,
+                        help='Use the Github GraphQL API to get the tags (requires '
+                        'an user and a token).')
     parser.add_argument('--version-schema', action='store', default='None',
                         help='Version schema of snapping repository')
+    add_cache_arguments(parser)
+    add_pool_arguments(parser)
+    parser.add_argument('--state', action='store', default=None,
+                        help='File where to keep the state of each part between runs, to '
+                        'evaluate again only the parts whose upstream tags changed.')
+    parser.add_argument('--output-mode', action='store', default='rewrite',
+                        choices=['rewrite', 'patch', 'diff'],
+                        help='How to write the updated snapcraft.yaml file: \'rewrite\' '
+                        'generates it again, \'patch\' changes only the updated lines '
+                        'of the original file, and \'diff\' prints the changes as an '
+                        'unified diff instead of writing the file.')
     parser.add_argument('--verbose', action='store_true', default=False)
     parser.add_argument('project', default='.', help='The project URI')
-    arguments = parser.parse_args(sys.argv[1:])
+    return parser.parse_args(sys.argv[1:])
+
+
+def update_source_tags(parts, manager_yaml) -> bool:
+    """ Replaces the source-tag of each part that has updates with the
+        most recent one, and returns whether any part was updated """
+    has_update = False
+    for part in parts:
+        if not part:
+            continue
+        if not part['updates']:
+            continue
+        if manager_yaml.get_part_entry(part['name'], 'source-tag') is None:
+            continue
+        print(f"Updating '{part['name']}' from version '{part['version'][0]}'"
+              f" to version '{part['updates'][0]['name']}'", file=sys.stderr)
+        manager_yaml.update_part_element(part['name'], 'source-tag',
+                                         f"'{part['updates'][0]['name']}'")
+        has_update = True
+    return has_update
+
+
+def write_output(manager_yaml, output_mode: str):
+    """ Writes the updated snapcraft.yaml file, or prints the changes as an
+        unified diff, depending on the output mode """
+    if output_mode == 'diff':
+        print(manager_yaml.get_diff(), end='')
+        return
+    with open('output_file', 'w', encoding="utf8") as output_file:
+        if output_mode == 'patch':
+            manager_yaml.write_patched_yaml(output_file)
+        else:
+            manager_yaml.write_yaml(output_file)
+
+
+def main():
+    """ Main code """
+    arguments = get_arguments()
 
     if arguments.project == '.':
         print('A project URI is mandatory', file=sys.stderr)
         sys.exit(-1)
 
-    manager = ProjectManager(arguments.github_user, arguments.github_token, arguments.verbose)
+    configure_clients(pool_maxsize=arguments.pool_size)
+    cache = new_cache(arguments)
+    manager = ProjectManager(arguments.github_user, arguments.github_token, arguments.verbose,
+                             cache)
 
     # get the most-updated SNAPCRAFT.YAML file
 
@@ -88,13 +160,16 @@ def main():
 
     manager_yaml = ManageYAML(contents)
 
-    snap = Snapcraft(not arguments.verbose)
-    snap.load_external_data(contents)
+    state = PartState(arguments.state) if arguments.state else None
+    snap = new_snapcraft(arguments, cache, state)
+    snap.load_manage_yaml(manager_yaml)
     if arguments.github_user:
         snap.set_secret('github', 'user', arguments.github_user)
     if arguments.github_token:
         snap.set_secret('github', 'token', arguments.github_token)
     parts, tag_error = snap.process_parts()
+    if state is not None:
+        state.save()
 
     if tag_error:
         sys.exit(1)
@@ -103,26 +178,15 @@ def main():
         print("The snapcraft.yaml file has no parts.", file=sys.stderr)
         sys.exit(0)  # no parts
 
-    has_update = False
-    for part in parts:
-        if not part:
-            continue
-        if not part['updates']:
-            continue
-        version_data = manager_yaml.get_part_element(part['name'], 'source-tag:')
-        if not version_data:
-            continue
-        print(f"Updating '{part['name']}' from version '{part['version'][0]}'"
-              f" to version '{part['updates'][0]['name']}'", file=sys.stderr)
-        version_data['data'] = f"source-tag: '{part['updates'][0]['name']}'"
-        has_update = True
+    has_update = update_source_tags(parts, manager_yaml)
 
     logging.basicConfig(level=logging.INFO)
     if (is_version_update(snap, manager_yaml, arguments, has_update) or has_update):
-        with open('output_file', 'w', encoding="utf8") as output_file:
-            output_file.write(manager_yaml.get_yaml())
+        write_output(manager_yaml, arguments.output_mode)
     else:
         print("No updates available", file=sys.stderr)
+    if (cache is not None) and arguments.verbose:
+        print(cache.get_summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":